@@ -0,0 +1,322 @@
+"""
+Бенчмарк конвейера парсинг -> статистика -> отчёты.
+
+Примеры:
+    python benchmark.py generate vacancies_1m.csv --rows 1000000
+    python benchmark.py run vacancies_1m.csv --save baseline.json
+    python benchmark.py run vacancies_1m.csv --compare baseline.json
+    python benchmark.py run --rows 100000 --stages parser_csv get_data_for_table
+"""
+import argparse
+import csv
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from main import ColumnName, CurrencyToRub, DataSet, InputConnect, Report, VacancyTable
+
+
+class DatasetGenerator:
+    """
+    Генератор синтетического csv с вакансиями в схеме ColumnName.
+    Строки пишутся по одной, поэтому размер файла (до десятков миллионов строк) не влияет на память
+
+    Attributes:
+        seed (int): зерно генератора, одинаковое зерно - одинаковый файл
+        malformed_share (float): доля битых строк (пустые поля, обрезанные строки)
+    """
+    NAMES = ('Программист', 'Программист Python', 'Java-программист', 'Frontend-разработчик', 'Аналитик',
+             'Аналитик данных', 'Менеджер по продажам', 'Бухгалтер', 'Водитель', 'Дизайнер', 'Юрист',
+             'Инженер-конструктор', 'Оператор call-центра', 'Системный администратор', 'Тестировщик')
+    AREAS = ('Москва', 'Санкт-Петербург', 'Новосибирск', 'Екатеринбург', 'Казань', 'Нижний Новгород',
+             'Челябинск', 'Самара', 'Омск', 'Ростов-на-Дону', 'Уфа', 'Красноярск', 'Воронеж', 'Пермь',
+             'Волгоград', 'Краснодар', 'Саратов', 'Тюмень', 'Тольятти', 'Ижевск', 'Минск', 'Алматы', 'Киев')
+    AREA_WEIGHTS = (30, 12) + (3,) * 12 + (1,) * 9
+    CURRENCY_WEIGHTS = {'RUR': 900, 'USD': 30, 'EUR': 15, 'KZT': 20, 'UAH': 15, 'BYR': 10, 'AZN': 3, 'GEL': 3,
+                        'KGS': 2, 'UZS': 2}
+    SKILLS = ('Python', 'SQL', 'Git', 'Linux', 'Java', 'Excel', '1С', 'Английский язык', 'Docker', 'Photoshop')
+    EXPERIENCE = ('noExperience', 'between1And3', 'between3And6', 'moreThan6')
+    PARAGRAPHS = ('<p><strong>Обязанности:</strong></p>', '<ul><li>разработка и поддержка сервисов</li>',
+                  '<li>участие в  код-ревью</li></ul>', '<p>Требования: опыт от <b>1 года</b>, знание SQL</p>',
+                  '<p>Условия: офис в центре, ДМС, "гибкий" график, премии</p>', 'Работа в команде, обучение')
+
+    def __init__(self, seed=1, malformed_share=0.03):
+        self.seed = seed
+        self.malformed_share = malformed_share
+
+    def write(self, file_name: str, rows: int, first_year=2007, last_year=2022):
+        """
+        Метод записи файла
+        :param (str) file_name: путь к файлу
+        :param (int) rows: количество строк без заголовка
+        :param (int) first_year: первый год публикации
+        :param (int) last_year: последний год публикации
+        :return: (int) количество битых строк
+        """
+        random_ = random.Random(self.seed)
+        currencies = list(self.CURRENCY_WEIGHTS)
+        currency_weights = list(self.CURRENCY_WEIGHTS.values())
+        malformed = 0
+        with open(file_name, 'w', encoding='utf_8_sig', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow([column.name for column in ColumnName])
+            for _ in range(rows):
+                row = self.get_row(random_, currencies, currency_weights, first_year, last_year)
+                if random_.random() < self.malformed_share:
+                    row = self.break_row(random_, row)
+                    malformed += 1
+                writer.writerow(row)
+        return malformed
+
+    def get_row(self, random_, currencies, currency_weights, first_year, last_year):
+        """
+        Метод генерации одной корректной строки
+        :return: (list) строка csv
+        """
+        currency = random_.choices(currencies, currency_weights)[0]
+        salary_from = random_.randint(10, 300) * 1000 / CurrencyToRub[currency].value
+        salary_from = max(round(salary_from, -2), 100)
+        salary_to = salary_from + round(salary_from * random_.random(), -2)
+        published_at = datetime(random_.randint(first_year, last_year), random_.randint(1, 12),
+                                random_.randint(1, 28), random_.randint(0, 23), random_.randint(0, 59),
+                                random_.randint(0, 59))
+        return [random_.choice(self.NAMES),
+                '\n'.join(random_.sample(self.PARAGRAPHS, random_.randint(1, len(self.PARAGRAPHS)))),
+                '\n'.join(random_.sample(self.SKILLS, random_.randint(1, 5))),
+                random_.choice(self.EXPERIENCE),
+                random_.choice(('True', 'False')),
+                f'ООО <i>Компания {random_.randint(1, 5000)}</i>',
+                f'{salary_from:.1f}' if random_.random() < 0.5 else str(int(salary_from)),
+                f'{salary_to:.1f}',
+                random_.choice(('True', 'False')),
+                currency,
+                random_.choices(self.AREAS, self.AREA_WEIGHTS)[0],
+                published_at.strftime('%Y-%m-%dT%H:%M:%S+0300')]
+
+    @staticmethod
+    def break_row(random_, row):
+        """
+        Метод порчи строки так, как это встречается в выгрузках: пустая вилка, пустая валюта или обрезанная строка
+        :param row: корректная строка
+        :return: (list) битая строка
+        """
+        kind = random_.randrange(3)
+        if kind == 0:
+            row[6] = ''
+        elif kind == 1:
+            row[9] = ''
+        else:
+            row = row[:random_.randint(1, len(row) - 1)]
+        return row
+
+
+class Benchmark:
+    """
+    Замер стадий конвейера: время (лучшее из repeat запусков), строк в секунду и пик памяти
+
+    Attributes:
+        file_name (str): файл с вакансиями
+        vacancy_name (str): профессия для статистики и отчётов
+        repeat (int): количество запусков каждой стадии
+        memory (bool): замерять пик памяти отдельным запуском под tracemalloc
+        output_dir (str): папка для отчётов, None - временная папка на время run, удаляется после замера
+    """
+    STAGES = ('csv_reader', 'parser_csv', 'get_data_for_table', 'vacancy_table', 'generate_excel',
+              'generate_image', 'generate_pdf')
+
+    def __init__(self, file_name, vacancy_name='Программист', repeat=3, memory=True, output_dir=None):
+        self.file_name = file_name
+        self.vacancy_name = vacancy_name
+        self.repeat = repeat
+        self.memory = memory
+        self.output_dir = output_dir
+        self.dataset = None
+        self.data = None
+
+    def get_stage(self, stage: str):
+        """
+        Метод получения функции стадии. Функция возвращает количество обработанных строк
+        или None, если строки не считаются (отчёты)
+        :param (str) stage: название стадии из STAGES
+        :return: функция без аргументов
+        """
+        file_name, vacancy_name = self.file_name, self.vacancy_name
+
+        def csv_reader():
+            naming, reader = DataSet.csv_reader(file_name)
+            return sum(1 for _ in reader)
+
+        def parser_csv():
+            self.dataset = DataSet(file_name)
+            return len(self.dataset.vacancies_objects)
+
+        def get_data_for_table():
+            if self.dataset is None:
+                self.dataset = DataSet(file_name)
+            self.data = InputConnect.get_data_for_table(self.dataset, vacancy_name)
+            return len(self.dataset.vacancies_objects)
+
+        def vacancy_table():
+            table = VacancyTable.from_file(file_name)
+            self.data = table.get_data_for_table(vacancy_name)
+            return len(table)
+
+        def report(generate):
+            def run():
+                if self.data is None:
+                    self.data = InputConnect.get_data_for_table(DataSet(file_name, stream=True), vacancy_name)
+                Report.image_cache.clear()
+                generate(*self.data[:6], vacancy_name, output_dir=tempfile.mkdtemp(dir=self.output_dir))
+            return run
+
+        return {'csv_reader': csv_reader, 'parser_csv': parser_csv, 'get_data_for_table': get_data_for_table,
+                'vacancy_table': vacancy_table, 'generate_excel': report(Report.generate_excel),
+                'generate_image': report(Report.generate_image), 'generate_pdf': report(Report.generate_pdf)}[stage]
+
+    def measure(self, stage: str):
+        """
+        Метод замера одной стадии
+        :param (str) stage: название стадии
+        :return: (dict) seconds, rows, rows_per_s, peak_mb или skipped с причиной
+        """
+        function = self.get_stage(stage)
+        times = []
+        rows = None
+        try:
+            for _ in range(self.repeat):
+                gc.collect()
+                start = time.perf_counter()
+                rows = function()
+                times.append(time.perf_counter() - start)
+        except (ImportError, OSError) as error:
+            return {'skipped': f'{type(error).__name__}: {str(error).splitlines()[0]}'}
+        result = {'seconds': round(min(times), 6), 'rows': rows,
+                  'rows_per_s': round(rows / min(times)) if rows and min(times) else None}
+        if self.memory:
+            gc.collect()
+            tracemalloc.start()
+            try:
+                function()
+                result['peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 3)
+            finally:
+                tracemalloc.stop()
+        return result
+
+    def run(self, stages=STAGES):
+        """
+        Метод замера стадий по порядку
+        :param stages: названия стадий
+        :return: (dict) результат с описанием окружения, пригодный для сохранения как baseline
+        """
+        results = {}
+        output_dir = self.output_dir
+        with tempfile.TemporaryDirectory(prefix='benchmark_') as temp_dir:
+            self.output_dir = output_dir or temp_dir
+            try:
+                for stage in stages:
+                    results[stage] = self.measure(stage)
+                    Benchmark.print_stage(stage, results[stage])
+            finally:
+                self.output_dir = output_dir
+        return {'file': os.path.basename(self.file_name), 'file_size': os.path.getsize(self.file_name),
+                'vacancy_name': self.vacancy_name, 'repeat': self.repeat,
+                'python': platform.python_version(), 'platform': platform.platform(),
+                'created_at': datetime.now().isoformat(timespec='seconds'), 'stages': results}
+
+    @staticmethod
+    def print_stage(stage: str, result: dict):
+        """
+        Метод печати результата стадии
+        :param (str) stage: название стадии
+        :param (dict) result: результат measure
+        """
+        if 'skipped' in result:
+            print(f"{stage:<20} пропущено ({result['skipped']})")
+            return
+        line = f"{stage:<20} {result['seconds']:>10.3f} с"
+        if result['rows_per_s']:
+            line += f" {result['rows_per_s']:>12,} строк/с"
+        if 'peak_mb' in result:
+            line += f" {result['peak_mb']:>10.1f} МБ"
+        print(line)
+
+    @staticmethod
+    def compare(result: dict, baseline: dict, threshold=0.1):
+        """
+        Метод сравнения с сохранённым замером
+        :param (dict) result: текущий замер
+        :param (dict) baseline: сохранённый замер
+        :param (float) threshold: допустимое относительное замедление или рост памяти
+        :return: (list) стадии с регрессией
+        """
+        regressions = []
+        for stage, current in result['stages'].items():
+            previous = baseline['stages'].get(stage)
+            if previous is None or 'skipped' in current or 'skipped' in previous:
+                continue
+            changes = []
+            for metric in ('seconds', 'peak_mb'):
+                if metric in current and previous.get(metric):
+                    change = current[metric] / previous[metric] - 1
+                    changes.append(f"{metric} {previous[metric]} -> {current[metric]} ({change:+.1%})")
+                    if change > threshold:
+                        regressions.append(stage)
+            print(f"{stage:<20} " + ', '.join(changes))
+        if result['file_size'] != baseline['file_size']:
+            print(f"Внимание: размер файла отличается от baseline ({baseline['file_size']})")
+        return sorted(set(regressions), key=list(result['stages']).index)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Бенчмарк парсинга, статистики и отчётов по вакансиям')
+    commands = parser.add_subparsers(dest='command', required=True)
+    generate = commands.add_parser('generate', help='создать синтетический csv')
+    generate.add_argument('file_name')
+    generate.add_argument('--rows', type=int, default=100_000)
+    generate.add_argument('--seed', type=int, default=1)
+    generate.add_argument('--malformed', type=float, default=0.03, help='доля битых строк')
+    run = commands.add_parser('run', help='замерить стадии конвейера')
+    run.add_argument('file_name', nargs='?', help='csv с вакансиями, без него файл генерируется во временной папке')
+    run.add_argument('--rows', type=int, default=100_000, help='размер генерируемого файла')
+    run.add_argument('--seed', type=int, default=1)
+    run.add_argument('--vacancy', default='Программист')
+    run.add_argument('--stages', nargs='+', choices=Benchmark.STAGES, default=Benchmark.STAGES)
+    run.add_argument('--repeat', type=int, default=3)
+    run.add_argument('--no-memory', action='store_true', help='не замерять пик памяти')
+    run.add_argument('--save', help='сохранить результат в json')
+    run.add_argument('--compare', help='сравнить с сохранённым json')
+    run.add_argument('--threshold', type=float, default=0.1, help='допустимая регрессия, по умолчанию 10%%')
+    args = parser.parse_args(argv)
+
+    if args.command == 'generate':
+        malformed = DatasetGenerator(args.seed, args.malformed).write(args.file_name, args.rows)
+        print(f"{args.file_name}: {args.rows} строк, из них битых {malformed}")
+        return 0
+
+    with tempfile.TemporaryDirectory(prefix='benchmark_') as temp_dir:
+        file_name = args.file_name
+        if file_name is None:
+            file_name = os.path.join(temp_dir, f'vacancies_{args.rows}.csv')
+            DatasetGenerator(args.seed).write(file_name, args.rows)
+        result = Benchmark(file_name, args.vacancy, args.repeat, not args.no_memory).run(args.stages)
+    if args.save:
+        with open(args.save, 'w', encoding='utf_8') as file:
+            json.dump(result, file, ensure_ascii=False, indent=2)
+    if args.compare:
+        with open(args.compare, encoding='utf_8') as file:
+            regressions = Benchmark.compare(result, json.load(file), args.threshold)
+        if regressions:
+            print('Регрессия: ' + ', '.join(regressions))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
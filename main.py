@@ -1,16 +1,34 @@
+import argparse
+import base64
+import cProfile
 import csv
+import hashlib
+import heapq
+import io
+import json
+import math
+import os
+import pstats
 import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from itertools import chain, repeat, zip_longest
 import numpy as np
-import matplotlib.pyplot as plt
-import pdfkit
 
 
-from openpyxl import Workbook
-from openpyxl.styles import Font, Border, Side
-from openpyxl.styles.numbers import FORMAT_PERCENTAGE_00
 from enum import Enum
 from datetime import datetime
-from jinja2 import Environment, FileSystemLoader
+from fractions import Fraction
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
 
 
 """Enum с полным название валюты"""
@@ -65,6 +83,206 @@ class CurrencyToRub(Enum):
     UZS = 0.0055
 
 
+class PipelineMetrics:
+    """
+    Метрики конвейера: время стадий и счётчики строк и байт.
+    Пока метрики не активированы (with PipelineMetrics() as metrics: ...), стадии не замеряются
+
+    Attributes:
+        active (PipelineMetrics): текущие метрики, None - замер выключен
+        profile (bool): снимать профиль cProfile на время замера
+        trace_memory (bool): замерять пик памяти стадий через tracemalloc
+        counters (dict): счётчики {название: значение}
+        stages (dict): стадии {название: [количество вызовов, суммарное время, максимальное время, пик памяти]},
+            максимальное время известно только для стадий, замеренных по одному вызову
+    """
+    active = None
+    COUNTERS = {'rows_read': 'Прочитано строк csv без заголовка',
+                'rows_dropped': 'Отброшено строк фильтром по длине и пустым полям',
+                'rows_parsed': 'Распаршено вакансий',
+                'bytes_read': 'Прочитано байт файла',
+                'cache_hits': 'Таблица загружена из кэша',
+                'cache_misses': 'Таблица построена заново'}
+
+    def __init__(self, profile=False, trace_memory=False):
+        self.profile = profile
+        self.trace_memory = trace_memory
+        self.counters = dict.fromkeys(PipelineMetrics.COUNTERS, 0)
+        self.stages = {}
+        self.profiler = None
+        self.peaks = []
+        self.previous = None
+
+    def __enter__(self):
+        self.previous, PipelineMetrics.active = PipelineMetrics.active, self
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if self.profile:
+            self.profiler = self.profiler or cProfile.Profile()
+            self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.profiler is not None:
+            self.profiler.disable()
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        PipelineMetrics.active, self.previous = self.previous, None
+
+    def count(self, name: str, value=1):
+        """
+        Метод увеличения счётчика
+        :param (str) name: название счётчика
+        :param (int) value: прибавляемое значение
+        """
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_time(self, name: str, seconds: float, calls=1, peak_bytes=None):
+        """
+        Метод добавления времени стадии
+        :param (str) name: название стадии
+        :param (float) seconds: время в секундах
+        :param (int) calls: количество вызовов, за которые набрано время
+        :param (int) peak_bytes: пик памяти за стадию
+        """
+        stage = self.stages.setdefault(name, [0, 0.0, None, None])
+        stage[0] += calls
+        stage[1] += seconds
+        if calls == 1:
+            stage[2] = max(stage[2] or 0.0, seconds)
+        if peak_bytes is not None:
+            stage[3] = max(stage[3] or 0, peak_bytes)
+
+    def merge(self, other):
+        """
+        Метод добавления метрик, собранных в другом процессе (например, в воркере пула отчётов)
+        :param (PipelineMetrics) other: метрики воркера
+        :return: (PipelineMetrics) self
+        """
+        for name, value in other.counters.items():
+            self.count(name, value)
+        for name, (calls, seconds, max_seconds, peak_bytes) in other.stages.items():
+            stage = self.stages.setdefault(name, [0, 0.0, None, None])
+            stage[0] += calls
+            stage[1] += seconds
+            if max_seconds is not None:
+                stage[2] = max(stage[2] or 0.0, max_seconds)
+            if peak_bytes is not None:
+                stage[3] = max(stage[3] or 0, peak_bytes)
+        return self
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Контекст замера стадии, вложенные стадии учитываются и во внешней
+        :param (str) name: название стадии
+        """
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        if tracing:
+            if self.peaks:
+                self.peaks[-1] = max(self.peaks[-1], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            self.peaks.append(0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            peak_bytes = None
+            if tracing:
+                peak_bytes = max(tracemalloc.get_traced_memory()[1], self.peaks.pop())
+                if self.peaks:
+                    self.peaks[-1] = max(self.peaks[-1], peak_bytes)
+            self.add_time(name, seconds, peak_bytes=peak_bytes)
+
+    @staticmethod
+    def timed(name: str):
+        """
+        Декоратор замера стадии, без активных метрик функция вызывается напрямую
+        :param (str) name: название стадии
+        """
+        def decorator(function):
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                metrics = PipelineMetrics.active
+                if metrics is None:
+                    return function(*args, **kwargs)
+                with metrics.stage(name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def to_dict(self):
+        """
+        Метод получения метрик в виде словаря
+        :return: (dict) counters и stages
+        """
+        stages = {}
+        for name, (calls, seconds, max_seconds, peak_bytes) in self.stages.items():
+            stages[name] = {'calls': calls, 'seconds': round(seconds, 6)}
+            if max_seconds is not None:
+                stages[name]['max_seconds'] = round(max_seconds, 6)
+            if peak_bytes is not None:
+                stages[name]['peak_bytes'] = peak_bytes
+        return {'counters': dict(self.counters), 'stages': stages}
+
+    def to_json(self) -> str:
+        """
+        Метод экспорта метрик в json
+        :return: (str) json
+        """
+        return json.dumps(self.to_dict(), ensure_ascii=False, indent=2)
+
+    def to_prometheus(self, prefix='vacancies') -> str:
+        """
+        Метод экспорта метрик в текстовом формате Prometheus
+        :param (str) prefix: префикс названий метрик
+        :return: (str) текст метрик
+        """
+        lines = []
+        for name, value in self.counters.items():
+            metric = f'{prefix}_{name}_total'
+            lines += [f'# HELP {metric} {PipelineMetrics.COUNTERS.get(name, name)}', f'# TYPE {metric} counter',
+                      f'{metric} {value}']
+        families = (('stage_calls_total', 'counter', 'Количество вызовов стадии', 'calls'),
+                    ('stage_seconds_total', 'counter', 'Суммарное время стадии в секундах', 'seconds'),
+                    ('stage_max_seconds', 'gauge', 'Максимальное время одного вызова стадии', 'max_seconds'),
+                    ('stage_peak_bytes', 'gauge', 'Пик памяти tracemalloc за стадию', 'peak_bytes'))
+        stages = self.to_dict()['stages']
+        for family, kind, description, field in families:
+            values = [(name, stage[field]) for name, stage in stages.items() if field in stage]
+            if not values:
+                continue
+            lines += [f'# HELP {prefix}_{family} {description}', f'# TYPE {prefix}_{family} {kind}']
+            lines += [f'{prefix}_{family}{{stage="{name}"}} {value}' for name, value in values]
+        return '\n'.join(lines) + '\n'
+
+    def get_profile_stats(self, limit=30, sort='cumulative') -> str:
+        """
+        Метод получения текстового отчёта cProfile
+        :param (int) limit: количество строк
+        :param (str) sort: поле сортировки pstats
+        :return: (str) отчёт, пустая строка если профиль не снимался
+        """
+        if self.profiler is None:
+            return ''
+        stream = io.StringIO()
+        pstats.Stats(self.profiler, stream=stream).sort_stats(sort).print_stats(limit)
+        return stream.getvalue()
+
+    def save(self, file_name: str):
+        """
+        Метод сохранения метрик: .prom и .txt - формат Prometheus, .pstats - профиль cProfile, иначе json
+        :param (str) file_name: название файла
+        """
+        if file_name.endswith('.pstats'):
+            self.profiler.dump_stats(file_name)
+            return
+        text = self.to_prometheus() if file_name.endswith(('.prom', '.txt')) else self.to_json()
+        with open(file_name, 'w', encoding='utf_8') as file:
+            file.write(text)
+
+
 class Salary:
     """Класс для представления зарплат
         Attributes:
@@ -72,6 +290,8 @@ class Salary:
             salary_to (int): Верхняя граница оклада
             salary_currency (int): Валюта оклада
     """
+    __slots__ = ('salary_from', 'salary_to', 'salary_currency')
+
     def __init__(self, salary_from, salary_to, salary_currency):
         """
         :param (str) salary_from:
@@ -90,6 +310,13 @@ class Salary:
         return ((int(float(self.salary_from)) + int(float(self.salary_to))) / 2) \
                * CurrencyToRub[self.salary_currency].value
 
+    def get_salary_sum(self):
+        """
+        Сумма границ оклада в исходной валюте, без конвертации
+        :return: (int) salary_from + salary_to
+        """
+        return int(float(self.salary_from)) + int(float(self.salary_to))
+
 
 class Vacancy:
     """
@@ -100,12 +327,1248 @@ class Vacancy:
         salary (str): Зарплата
         area_name (str): Название области
         published_at (str): Вребя публикации вакансии
+        fields (dict): дополнительные колонки {название: LazyText}, None - не запрашивались
     """
-    def __init__(self, name, salary, area_name, published_at):
+    __slots__ = ('name', 'salary', 'area_name', 'published_at', 'fields')
+
+    def __init__(self, name, salary, area_name, published_at, fields=None):
         self.name = name
         self.salary = salary
         self.area_name = area_name
         self.published_at = published_at
+        self.fields = fields
+
+    def get_field(self, name: str):
+        """
+        Метод получения дополнительной колонки, очистка от html выполняется при первом обращении
+        :param (str) name: название колонки, например description или key_skills
+        :return: очищенная строка или список строк для многострочного поля
+        """
+        if self.fields is None or name not in self.fields:
+            raise KeyError(f"Колонка {name!r} не загружена, её нужно запросить через DataSet(..., columns=...)")
+        return self.fields[name].get()
+
+
+class LazyText:
+    """
+    Текстовое поле, которое очищается от html только при первом обращении
+
+    Attributes:
+        raw (str): исходная строка, после очистки None
+        value: очищенная строка или список строк
+    """
+    __slots__ = ('raw', 'value')
+
+    def __init__(self, raw: str):
+        self.raw = raw
+        self.value = None
+
+    def get(self):
+        """
+        Метод получения очищенного значения
+        :return: очищенная строка или список строк для многострочного поля
+        """
+        if self.value is None:
+            self.value = DataSet.clear_field(self.raw)
+            self.raw = None
+        return self.value
+
+
+class PublishedAt:
+    """
+    Класс разбора даты публикации вакансии вида 2022-07-05T18:19:30+0300.
+    Год, месяц и день берутся срезами строки и кэшируются по дате (первые 10 символов),
+    datetime.strptime вызывается только для строк другого формата
+    """
+    FORMAT = '%Y-%m-%dT%H:%M:%S%z'
+    cache = {}
+
+    @staticmethod
+    def parse(value: str):
+        """
+        Метод разбора даты публикации
+        :param (str) value: дата публикации
+        :return: (tuple) год, месяц, день
+        """
+        if len(value) == 24 and value[10] == 'T' and value[13] == ':' and value[16] == ':' and value[19] in '+-':
+            date = value[:10]
+            result = PublishedAt.cache.get(date)
+            if result is not None:
+                return result
+            if date[4] == '-' and date[7] == '-' and date[:4].isdigit() and date[5:7].isdigit() \
+                    and date[8:].isdigit():
+                result = (int(date[:4]), int(date[5:7]), int(date[8:]))
+                datetime(*result)
+                PublishedAt.cache[date] = result
+                return result
+        published_at = datetime.strptime(value, PublishedAt.FORMAT)
+        return published_at.year, published_at.month, published_at.day
+
+
+class CurrencyRates:
+    """
+    Класс курсов валют к рублю по месяцам.
+    Курсы хранятся плотным массивом [валюта, месяц] в порядке CurrencyToRub, поэтому перевод в рубли
+    всей таблицы вакансий - одна векторная выборка по индексам. Пропущенный курс берётся из предыдущего месяца,
+    до первого известного курса - из CurrencyToRub. Месяцы вне таблицы получают курс ближайшего крайнего месяца
+
+    Attributes:
+        first_month (int): номер первого месяца таблицы (год * 12 + месяц - 1)
+        rates (np.ndarray): float64 курсы [валюта, месяц]
+    """
+    CACHE_VERSION = 1
+    loaded = {}
+
+    def __init__(self, first_month: int, rates):
+        self.first_month = first_month
+        self.rates = rates
+
+    @staticmethod
+    def load(file_name):
+        """
+        Метод загрузки курсов из csv или json. Результат кэшируется в процессе и в файле <file_name>.npz,
+        кэш сбрасывается при изменении размера или времени изменения файла курсов.
+        Если кэш записать нельзя (папка только для чтения), возвращаются разобранные курсы
+        :param (str) file_name: файл курсов
+        :return: (CurrencyRates) курсы
+        """
+        stat = os.stat(file_name)
+        key = np.array([CurrencyRates.CACHE_VERSION, stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+        loaded = CurrencyRates.loaded.get(os.path.abspath(file_name))
+        if loaded is not None and np.array_equal(loaded[0], key):
+            return loaded[1]
+        cache_file = f'{file_name}.npz'
+        try:
+            with np.load(cache_file) as cache:
+                if not np.array_equal(cache['key'], key):
+                    raise ValueError('Кэш курсов устарел')
+                rates = CurrencyRates(int(cache['first_month']), cache['rates'])
+        except (OSError, ValueError, KeyError):
+            rates = CurrencyRates.from_records(CurrencyRates.read_records(file_name))
+            temp_file = f'{cache_file}.{os.getpid()}.tmp.npz'
+            try:
+                np.savez(temp_file, key=key, first_month=rates.first_month, rates=rates.rates)
+                os.replace(temp_file, cache_file)
+            except OSError:
+                if os.path.exists(temp_file):
+                    os.remove(temp_file)
+        CurrencyRates.loaded[os.path.abspath(file_name)] = (key, rates)
+        return rates
+
+    @staticmethod
+    def read_records(file_name):
+        """
+        Метод чтения файла курсов.
+        csv: колонка date (YYYY-MM или YYYY-MM-DD) и по колонке на валюту;
+        json: {"YYYY-MM": {"USD": 60.66, ...}, ...}
+        :param (str) file_name: файл курсов
+        :return: (dict) {номер месяца: {валюта: курс}}
+        """
+        with open(file_name, encoding='utf_8_sig') as file:
+            if file_name.lower().endswith('.json'):
+                rows = [dict(values, date=date) for date, values in json.load(file).items()]
+            else:
+                rows = list(csv.DictReader(file))
+        records = {}
+        for row in rows:
+            date = row.pop('date')
+            month = int(date[:4]) * 12 + int(date[5:7]) - 1
+            records[month] = {currency: float(rate) for currency, rate in row.items()
+                              if currency in CurrencyToRub.__members__ and rate not in ('', None)}
+        return records
+
+    @staticmethod
+    def from_records(records: dict):
+        """
+        Метод построения плотного массива курсов
+        :param (dict) records: {номер месяца: {валюта: курс}}
+        :return: (CurrencyRates) курсы
+        """
+        if not records:
+            first_month, length = 0, 1
+        else:
+            first_month = min(records)
+            length = max(records) - first_month + 1
+        rates = np.empty((len(CurrencyToRub), length), dtype=np.float64)
+        for index, currency in enumerate(CurrencyToRub):
+            rate = currency.value
+            for month in range(length):
+                rate = records.get(first_month + month, {}).get(currency.name, rate)
+                rates[index, month] = rate
+        return CurrencyRates(first_month, rates)
+
+    def get_month_index(self, years, months):
+        """
+        Метод получения индекса месяца в массиве курсов
+        :param years: год или массив годов
+        :param months: месяц или массив месяцев
+        :return: индекс или массив индексов
+        """
+        return np.clip(np.asarray(years, dtype=np.int64) * 12 + months - 1 - self.first_month,
+                       0, self.rates.shape[1] - 1)
+
+    def get_rates(self, currency_codes, years, months):
+        """
+        Метод векторной выборки курсов для строк таблицы
+        :param (np.ndarray) currency_codes: индексы валют в CurrencyToRub
+        :param (np.ndarray) years: годы
+        :param (np.ndarray) months: месяцы
+        :return: (np.ndarray) курсы
+        """
+        return self.rates[currency_codes, self.get_month_index(years, months)]
+
+    def get_rate(self, currency: str, year: int, month: int) -> float:
+        """
+        Метод получения одного курса
+        :param (str) currency: код валюты
+        :param (int) year: год
+        :param (int) month: месяц
+        :return: (float) курс к рублю
+        """
+        return float(self.rates[VacancyTable.CURRENCIES.index(currency), self.get_month_index(year, month)])
+
+
+class QuantileSketch:
+    """
+    Класс потоковой оценки квантилей (KLL-скетч).
+    Значения хранятся в уровнях-компакторах: когда уровень переполняется, он сортируется и каждое второе
+    значение переходит на следующий уровень с удвоенным весом. Память O(k log(n / k)),
+    скетчи разных частей данных можно сливать, ошибка ранга порядка 1 / k
+
+    Attributes:
+        k (int): размер верхнего компактора, задаёт точность
+        compactors (list): уровни, значение на уровне h имеет вес 2 ** h
+        offsets (list): чередующееся смещение сжатия для каждого уровня
+        count (int): количество учтённых значений
+    """
+    QUANTILES = (('p25', 0.25), ('median', 0.5), ('p75', 0.75), ('p90', 0.9))
+
+    def __init__(self, k=200):
+        self.k = k
+        self.compactors = [[]]
+        self.offsets = [0]
+        self.count = 0
+        self.size = 0
+        self.max_size = self.get_capacity(0)
+
+    def get_capacity(self, height: int) -> int:
+        """
+        Метод получения ёмкости уровня: нижние уровни меньше верхнего в (2 / 3) ** глубина раз
+        :param (int) height: номер уровня
+        :return: (int) ёмкость
+        """
+        depth = len(self.compactors) - height - 1
+        return int(math.ceil(self.k * (2 / 3) ** depth)) + 1
+
+    def update(self, value: float):
+        """
+        Метод добавления значения
+        :param (float) value: значение
+        """
+        self.compactors[0].append(value)
+        self.count += 1
+        self.size += 1
+        if self.size >= self.max_size:
+            self.compress()
+
+    def compress(self):
+        """
+        Метод сжатия переполненных уровней
+        """
+        while self.size >= self.max_size:
+            for height, compactor in enumerate(self.compactors):
+                if len(compactor) < self.get_capacity(height):
+                    continue
+                if height + 1 == len(self.compactors):
+                    self.compactors.append([])
+                    self.offsets.append(0)
+                compactor.sort()
+                rest = [compactor.pop()] if len(compactor) % 2 else []
+                self.compactors[height + 1].extend(compactor[self.offsets[height]::2])
+                self.offsets[height] ^= 1
+                self.compactors[height] = rest
+                break
+            self.size = sum(len(compactor) for compactor in self.compactors)
+            self.max_size = sum(self.get_capacity(height) for height in range(len(self.compactors)))
+
+    def merge(self, other):
+        """
+        Метод слияния со скетчем другой части данных
+        :param (QuantileSketch) other: скетч
+        :return: (QuantileSketch) self
+        """
+        while len(self.compactors) < len(other.compactors):
+            self.compactors.append([])
+            self.offsets.append(0)
+        for height, compactor in enumerate(other.compactors):
+            self.compactors[height].extend(compactor)
+        self.count += other.count
+        self.size = sum(len(compactor) for compactor in self.compactors)
+        self.max_size = sum(self.get_capacity(height) for height in range(len(self.compactors)))
+        self.compress()
+        return self
+
+    def get_quantiles(self):
+        """
+        Метод оценки квантилей QUANTILES
+        :return: (dict) {название квантиля: значение}
+        """
+        items = sorted((value, 1 << height) for height, compactor in enumerate(self.compactors)
+                       for value in compactor)
+        total = sum(weight for _, weight in items)
+        result = {}
+        cumulative = 0
+        position = 0
+        for name, quantile in QuantileSketch.QUANTILES:
+            while position < len(items) - 1 and cumulative + items[position][1] < quantile * total:
+                cumulative += items[position][1]
+                position += 1
+            result[name] = int(items[position][0]) if items else 0
+        return result
+
+
+class TopAreas:
+    """
+    Класс выбора лучших городов: K городов с наибольшей средней зарплатой и K городов с наибольшей долей вакансий
+    среди городов, где доля вакансий не меньше min_share. Выбор делается кучей (heapq.nlargest) за O(areas log K)
+    и при равенстве сохраняет порядок городов, как устойчивая сортировка.
+    Накопление по городам и слияние частичных результатов воркеров выполняет StatisticsAggregator
+    (или VacancyTable), сюда передаются уже готовые значения
+
+    Attributes:
+        k (int): количество городов в каждом рейтинге
+        min_share (float): минимальная доля вакансий города
+    """
+    def __init__(self, k=10, min_share=0.01):
+        self.k = k
+        self.min_share = min_share
+
+    def get_threshold(self, total: int) -> int:
+        """
+        Метод получения минимального количества вакансий города, доля считается точно, без ошибок округления
+        :param (int) total: общее количество вакансий
+        :return: (int) порог
+        """
+        return int(Fraction(str(self.min_share)) * total)
+
+    def select(self, areas, total: int):
+        """
+        Метод выбора лучших городов
+        :param areas: итератор (город, количество, средняя зарплата)
+        :param (int) total: общее количество вакансий
+        :return: area_salary: {город: средняя зарплата}, area_count: {город: доля вакансий}
+        """
+        threshold = self.get_threshold(total)
+        eligible = [area for area in areas if area[1] >= threshold]
+        by_salary = heapq.nlargest(self.k, eligible, key=lambda area: area[2])
+        by_count = heapq.nlargest(self.k, eligible, key=lambda area: area[1])
+        area_salary = {area[0]: int(area[2]) for area in by_salary}
+        area_count = {area[0]: round(area[1] / total, 4) for area in by_count}
+        return area_salary, area_count
+
+
+class StatisticsAggregator:
+    """
+    Класс однопроходного подсчёта статистики по вакансиям.
+    Для каждого года, года выбранной профессии и города хранится накопитель [количество, {валюта: сумма}],
+    где сумма - целая сумма salary_from + salary_to в исходной валюте. Конвертация в рубли выполняется
+    один раз на группу в get_data, а результат не зависит от порядка строк.
+    С курсами по месяцам (rates) ключом суммы служит (валюта, год, месяц).
+
+    Attributes:
+        vac_name (str): название выбранной профессии, None - статистика по профессии не собирается
+        total (int): количество учтённых вакансий
+        years (dict): накопители по годам
+        years_vacancy (dict): накопители по годам для выбранной профессии
+        areas (dict): накопители по городам
+        rates (CurrencyRates): курсы валют по месяцам, None - курсы CurrencyToRub
+        sketches (dict): скетчи квантилей {'years': {}, 'years_vacancy': {}, 'areas': {}}, None - квантили не считаются
+        top_areas (TopAreas): настройки рейтинга городов
+    """
+    RATES = {currency.name: currency.value for currency in CurrencyToRub}
+
+    def __init__(self, vac_name, rates=None, quantiles=False, top_areas=None):
+        self.vac_name = vac_name
+        self.top_areas = top_areas or TopAreas()
+        self.rates = rates
+        self.total = 0
+        self.years = {}
+        self.years_vacancy = {}
+        self.areas = {}
+        self.sketches = {'years': {}, 'years_vacancy': {}, 'areas': {}} if quantiles else None
+
+    def add(self, vacancy):
+        """
+        Метод учёта одной вакансии
+        :param (Vacancy) vacancy: вакансия
+        """
+        year, month, _ = PublishedAt.parse(vacancy.published_at)
+        currency = vacancy.salary.salary_currency
+        if self.rates is not None:
+            currency = (currency, year, month)
+        self.add_values(vacancy.name, vacancy.salary.get_salary_sum(), currency, vacancy.area_name, year)
+
+    def add_values(self, name, salary_sum: int, currency: str, area_name: str, year: int):
+        """
+        Метод учёта одной вакансии по уже разобранным значениям
+        :param name: название вакансии
+        :param (int) salary_sum: salary_from + salary_to в исходной валюте
+        :param currency: код валюты или (код валюты, год, месяц) при курсах по месяцам
+        :param (str) area_name: название города
+        :param (int) year: год публикации
+        """
+        self.total += 1
+        is_vacancy = self.vac_name is not None and self.vac_name in name
+        StatisticsAggregator.add_to_accumulator(self.years, year, currency, salary_sum)
+        if is_vacancy:
+            StatisticsAggregator.add_to_accumulator(self.years_vacancy, year, currency, salary_sum)
+        StatisticsAggregator.add_to_accumulator(self.areas, area_name, currency, salary_sum)
+        if self.sketches is not None:
+            salary = salary_sum / 2 * (self.rates.get_rate(*currency) if self.rates is not None
+                                       else StatisticsAggregator.RATES[currency])
+            StatisticsAggregator.add_to_sketch(self.sketches['years'], year, salary)
+            if is_vacancy:
+                StatisticsAggregator.add_to_sketch(self.sketches['years_vacancy'], year, salary)
+            StatisticsAggregator.add_to_sketch(self.sketches['areas'], area_name, salary)
+
+    @staticmethod
+    def add_to_sketch(sketches: dict, key, salary: float):
+        """
+        Метод добавления зарплаты в скетч квантилей
+        :param (dict) sketches: скетчи вида {ключ: QuantileSketch}
+        :param key: ключ (год или город)
+        :param (float) salary: зарплата в рублях
+        """
+        sketch = sketches.get(key)
+        if sketch is None:
+            sketch = sketches[key] = QuantileSketch()
+        sketch.update(salary)
+
+    @staticmethod
+    def add_to_accumulator(accumulators: dict, key, currency: str, salary_sum: int):
+        """
+        Метод добавления зарплаты в накопитель
+        :param (dict) accumulators: накопители вида {ключ: [количество, {валюта: сумма}]}
+        :param key: ключ (год или город)
+        :param (str) currency: код валюты
+        :param (int) salary_sum: salary_from + salary_to в исходной валюте
+        """
+        accumulator = accumulators.get(key)
+        if accumulator is None:
+            accumulators[key] = [1, {currency: salary_sum}]
+            return
+        accumulator[0] += 1
+        sums = accumulator[1]
+        sums[currency] = sums.get(currency, 0) + salary_sum
+
+    def merge(self, other):
+        """
+        Метод слияния с частичным результатом, посчитанным по другой части файла.
+        Части нужно сливать в порядке следования в файле, тогда порядок городов совпадёт с последовательным проходом
+        :param (StatisticsAggregator) other: частичный результат
+        :return: (StatisticsAggregator) self
+        """
+        self.total += other.total
+        StatisticsAggregator.merge_accumulators(self.years, other.years)
+        StatisticsAggregator.merge_accumulators(self.years_vacancy, other.years_vacancy)
+        StatisticsAggregator.merge_accumulators(self.areas, other.areas)
+        if self.sketches is not None and other.sketches is not None:
+            for group, sketches in other.sketches.items():
+                for key, sketch in sketches.items():
+                    if key in self.sketches[group]:
+                        self.sketches[group][key].merge(sketch)
+                    else:
+                        self.sketches[group][key] = sketch
+        return self
+
+    @staticmethod
+    def merge_accumulators(accumulators: dict, other_accumulators: dict):
+        """
+        Метод добавления накопителей other_accumulators в accumulators
+        :param (dict) accumulators: накопители вида {ключ: [количество, {валюта: сумма}]}, изменяются
+        :param (dict) other_accumulators: добавляемые накопители
+        """
+        for key, (count, sums) in other_accumulators.items():
+            accumulator = accumulators.get(key)
+            if accumulator is None:
+                accumulators[key] = [count, dict(sums)]
+                continue
+            accumulator[0] += count
+            for currency, salary_sum in sums.items():
+                accumulator[1][currency] = accumulator[1].get(currency, 0) + salary_sum
+
+    def get_mean(self, accumulator) -> float:
+        """
+        Метод получения средней зарплаты в рублях по накопителю
+        :param accumulator: накопитель [количество, {валюта: сумма}]
+        :return: (float) средняя зарплата в рублях
+        """
+        count, sums = accumulator
+        if self.rates is not None:
+            return sum(sums[key] / 2 * self.rates.get_rate(*key) for key in sorted(sums)) / count
+        return sum(sums[currency.name] / 2 * currency.value for currency in CurrencyToRub
+                   if currency.name in sums) / count
+
+    def get_data(self):
+        """
+        Метод получения итоговых данных
+        :return: years_salary, years_count, years_salary_vacancy, years_count_vacancy, area_salary, area_count
+        """
+        if self.total == 0:
+            return {}, {}, {}, {}, {}, {}
+
+        years_range = range(min(self.years), max(self.years) + 1)
+        years_salary = {year: int(self.get_mean(self.years[year])) if year in self.years else 0
+                        for year in years_range}
+        years_count = {year: self.years[year][0] if year in self.years else 0 for year in years_range}
+        years_salary_vacancy = {year: int(self.get_mean(self.years_vacancy[year]))
+                                if year in self.years_vacancy else 0 for year in years_range}
+        years_count_vacancy = {year: self.years_vacancy[year][0] if year in self.years_vacancy else 0
+                               for year in years_range}
+
+        threshold = self.top_areas.get_threshold(self.total)
+        area_salary, area_count = self.top_areas.select(
+            ((area_name, accumulator[0], self.get_mean(accumulator))
+             for area_name, accumulator in self.areas.items() if accumulator[0] >= threshold), self.total)
+
+        return years_salary, years_count, years_salary_vacancy, years_count_vacancy, area_salary, area_count
+
+    def get_quantiles(self):
+        """
+        Метод получения квантилей зарплат (p25, медиана, p75, p90).
+        Годы заполнены так же, как в get_data, города - те, что проходят порог доли вакансий, по убыванию медианы
+        :return: (dict) {'years': {год: {квантиль: зарплата}}, 'years_vacancy': {...}, 'areas': {город: {...}}}
+        """
+        if self.sketches is None or self.total == 0:
+            return {'years': {}, 'years_vacancy': {}, 'areas': {}}
+        empty = {name: 0 for name, _ in QuantileSketch.QUANTILES}
+        years_range = range(min(self.years), max(self.years) + 1)
+        years = {year: self.sketches['years'][year].get_quantiles() if year in self.sketches['years']
+                 else dict(empty) for year in years_range}
+        years_vacancy = {year: self.sketches['years_vacancy'][year].get_quantiles()
+                         if year in self.sketches['years_vacancy'] else dict(empty) for year in years_range}
+        areas = [(area_name, sketch.get_quantiles()) for area_name, sketch in self.sketches['areas'].items()
+                 if self.areas[area_name][0] >= self.top_areas.get_threshold(self.total)]
+        areas = dict(sorted(areas, key=lambda item: item[1]['median'], reverse=True))
+        return {'years': years, 'years_vacancy': years_vacancy, 'areas': areas}
+
+
+class NameIndex:
+    """
+    Индекс названий вакансий по триграммам для быстрого поиска профессии по подстроке.
+    Триграммы строятся по уникальным названиям, найденные названия проверяются через in,
+    поэтому результат совпадает с проверкой vac_name in name по каждой строке.
+
+    Attributes:
+        names (list): уникальные названия вакансий
+        trigrams (dict): {триграмма: список кодов названий}
+        other_names (list): коды многострочных названий, они проверяются без триграмм
+        cache (dict): {профессия: номера строк} для последних CACHE_SIZE запросов, вытесняется самый давний
+        row_order (np.ndarray): номера строк, упорядоченные по коду названия
+        row_offsets (np.ndarray): границы строк каждого названия в row_order
+    """
+    CACHE_SIZE = 16
+
+    def __init__(self, names, name_codes):
+        """
+        :param (list) names: уникальные названия вакансий
+        :param (np.ndarray) name_codes: код названия для каждой строки таблицы
+        """
+        self.names = names
+        self.trigrams = {}
+        self.other_names = []
+        self.cache = {}
+        for code, name in enumerate(names):
+            if not isinstance(name, str):
+                self.other_names.append(code)
+                continue
+            for trigram in {name[index:index + 3] for index in range(len(name) - 2)}:
+                self.trigrams.setdefault(trigram, []).append(code)
+        self.row_order = np.argsort(name_codes, kind='stable')
+        self.row_offsets = np.concatenate(([0], np.cumsum(np.bincount(name_codes, minlength=len(names)))))
+
+    def find(self, vac_name):
+        """
+        Метод поиска кодов названий, содержащих vac_name
+        :param (str) vac_name: название профессии
+        :return: (list) коды названий по возрастанию
+        """
+        if len(vac_name) < 3:
+            return [code for code, name in enumerate(self.names) if vac_name in name]
+        postings = sorted((self.trigrams.get(vac_name[index:index + 3], [])
+                           for index in range(len(vac_name) - 2)), key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            if not candidates:
+                break
+            candidates.intersection_update(posting)
+        candidates.update(self.other_names)
+        return sorted(code for code in candidates if vac_name in self.names[code])
+
+    def get_rows(self, vac_name):
+        """
+        Метод получения номеров строк таблицы, название которых содержит vac_name
+        :param (str) vac_name: название профессии
+        :return: (np.ndarray) возрастающие номера строк
+        """
+        rows = self.cache.pop(vac_name, None)
+        if rows is None:
+            codes = self.find(vac_name)
+            parts = [self.row_order[self.row_offsets[code]:self.row_offsets[code + 1]] for code in codes]
+            rows = np.sort(np.concatenate(parts)) if parts else np.empty(0, dtype=np.intp)
+        while len(self.cache) >= NameIndex.CACHE_SIZE:
+            self.cache.pop(next(iter(self.cache), None), None)
+        self.cache[vac_name] = rows
+        return rows
+
+
+class VacancyTable:
+    """
+    Колоночное представление вакансий на массивах numpy.
+    Строковые колонки (название, город, валюта) хранятся как категориальные int-коды,
+    статистика считается групповыми операциями numpy без цикла по строкам.
+
+    Attributes:
+        names (list): уникальные названия вакансий
+        name_codes (np.ndarray): int32 индекс названия для каждой строки
+        salary_from (np.ndarray): float64 нижняя граница оклада
+        salary_to (np.ndarray): float64 верхняя граница оклада
+        currency_codes (np.ndarray): int8 индекс валюты в CurrencyToRub
+        areas (list): уникальные названия городов
+        area_codes (np.ndarray): int32 индекс города для каждой строки
+        years (np.ndarray): int16 год публикации
+        months (np.ndarray): int8 месяц публикации
+        days (np.ndarray): int8 день публикации
+        top_areas (TopAreas): настройки рейтинга городов
+    """
+    CURRENCIES = [currency.name for currency in CurrencyToRub]
+    COLUMNS = ('name_codes', 'salary_from', 'salary_to', 'currency_codes', 'area_codes', 'years', 'months', 'days')
+    CACHE_VERSION = 3
+
+    def __init__(self, names, name_codes, salary_from, salary_to, currency_codes, areas, area_codes,
+                 years, months, days):
+        self.names = names
+        self.name_codes = name_codes
+        self.salary_from = salary_from
+        self.salary_to = salary_to
+        self.currency_codes = currency_codes
+        self.areas = areas
+        self.area_codes = area_codes
+        self.years = years
+        self.months = months
+        self.days = days
+        self.currency_rates = None
+        self.salaries = None
+        self.name_index = None
+        self.overall_data = None
+        self.rollups = None
+        self.top_areas = TopAreas()
+
+    def __len__(self):
+        return len(self.years)
+
+    @staticmethod
+    def from_vacancies(vacancies):
+        """
+        Метод построения таблицы по итератору вакансий
+        :param vacancies: итератор Vacancy
+        :return: (VacancyTable) таблица
+        """
+        names, areas = {}, {}
+        currencies = {name: index for index, name in enumerate(VacancyTable.CURRENCIES)}
+        name_codes, area_codes = array('i'), array('i')
+        salary_from, salary_to = array('d'), array('d')
+        currency_codes, years, months, days = array('b'), array('h'), array('b'), array('b')
+        for item in vacancies:
+            name = tuple(item.name) if isinstance(item.name, list) else item.name
+            name_codes.append(names.setdefault(name, len(names)))
+            area_codes.append(areas.setdefault(item.area_name, len(areas)))
+            salary_from.append(float(item.salary.salary_from))
+            salary_to.append(float(item.salary.salary_to))
+            currency_codes.append(currencies[item.salary.salary_currency])
+            year, month, day = PublishedAt.parse(item.published_at)
+            years.append(year)
+            months.append(month)
+            days.append(day)
+        return VacancyTable(list(names), np.frombuffer(name_codes, dtype=np.int32),
+                            np.frombuffer(salary_from, dtype=np.float64), np.frombuffer(salary_to, dtype=np.float64),
+                            np.frombuffer(currency_codes, dtype=np.int8), list(areas),
+                            np.frombuffer(area_codes, dtype=np.int32), np.frombuffer(years, dtype=np.int16),
+                            np.frombuffer(months, dtype=np.int8), np.frombuffer(days, dtype=np.int8))
+
+    @staticmethod
+    @PipelineMetrics.timed('from_file')
+    def from_file(file_name):
+        """
+        Метод построения таблицы по csv файлу, файл читается потоково
+        :param (str) file_name: название файла
+        :return: (VacancyTable) таблица
+        """
+        return VacancyTable.from_vacancies(DataSet(file_name, stream=True).vacancies_objects)
+
+    def save(self, directory, meta: dict):
+        """
+        Метод сохранения таблицы на диск: колонки в .npy и строки в strings.json пишутся в новую подпапку,
+        затем meta.json с ключом кэша и именем подпапки атомарно заменяется через os.replace.
+        Файлы, уже отображённые в память load, не перезаписываются: старая подпапка удаляется
+        только после переключения meta.json, а открытые отображения остаются действительными
+        :param (str) directory: папка кэша
+        :param (dict) meta: ключ кэша
+        """
+        os.makedirs(directory, exist_ok=True)
+        meta_file = os.path.join(directory, 'meta.json')
+        data_dir = tempfile.mkdtemp(prefix='table_', dir=directory)
+        try:
+            for column in VacancyTable.COLUMNS:
+                np.save(os.path.join(data_dir, f'{column}.npy'), getattr(self, column))
+            names = [list(name) if isinstance(name, tuple) else name for name in self.names]
+            with open(os.path.join(data_dir, 'strings.json'), 'w', encoding='utf_8') as file:
+                json.dump({'names': names, 'areas': self.areas}, file, ensure_ascii=False)
+            previous = VacancyTable.read_meta(directory).get('data')
+            temp_file = f'{meta_file}.{os.getpid()}.tmp'
+            with open(temp_file, 'w', encoding='utf_8') as file:
+                json.dump(dict(meta, data=os.path.basename(data_dir)), file, ensure_ascii=False)
+            os.replace(temp_file, meta_file)
+        except BaseException:
+            shutil.rmtree(data_dir, ignore_errors=True)
+            raise
+        if previous and previous != os.path.basename(data_dir):
+            shutil.rmtree(os.path.join(directory, previous), ignore_errors=True)
+
+    @staticmethod
+    def read_meta(directory):
+        """
+        Метод чтения meta.json кэша
+        :param (str) directory: папка кэша
+        :return: (dict) ключ кэша и имя подпапки с данными, пустой словарь если кэша нет
+        """
+        try:
+            with open(os.path.join(directory, 'meta.json'), encoding='utf_8') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def load(directory, mmap=True):
+        """
+        Метод загрузки таблицы, сохранённой save
+        :param (str) directory: папка кэша
+        :param (bool) mmap: отображать колонки в память вместо чтения
+        :return: (VacancyTable) таблица
+        """
+        directory = os.path.join(directory, VacancyTable.read_meta(directory)['data'])
+        with open(os.path.join(directory, 'strings.json'), encoding='utf_8') as file:
+            strings = json.load(file)
+        names = [tuple(name) if isinstance(name, list) else name for name in strings['names']]
+        columns = {column: np.load(os.path.join(directory, f'{column}.npy'), mmap_mode='r' if mmap else None)
+                   for column in VacancyTable.COLUMNS}
+        return VacancyTable(names=names, areas=strings['areas'], **columns)
+
+    @staticmethod
+    def get_file_hash(file_name):
+        """
+        Метод подсчёта sha256 содержимого файла
+        :param (str) file_name: название файла
+        :return: (str) hex хэш
+        """
+        digest = hashlib.sha256()
+        with open(file_name, 'rb') as file:
+            for block in iter(lambda: file.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def get_cache_key(file_name, check_hash=False):
+        """
+        Метод получения ключа кэша файла
+        :param (str) file_name: название файла
+        :param (bool) check_hash: добавить в ключ хэш содержимого
+        :return: (dict) версия формата, путь, размер, время изменения и, если нужно, хэш
+        """
+        stat = os.stat(file_name)
+        key = {'version': VacancyTable.CACHE_VERSION, 'path': os.path.abspath(file_name),
+               'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        if check_hash:
+            key['sha256'] = VacancyTable.get_file_hash(file_name)
+        return key
+
+    @staticmethod
+    @PipelineMetrics.timed('from_cache')
+    def from_cache(file_name, check_hash=False, cache_dir=None):
+        """
+        Метод получения таблицы через кэш на диске.
+        Кэш действителен, если совпали версия, путь и размер, а также время изменения
+        (или хэш содержимого при check_hash). Иначе файл парсится заново и кэш перезаписывается;
+        если кэш записать нельзя (например, папка только для чтения), возвращается разобранная таблица
+        :param (str) file_name: название файла
+        :param (bool) check_hash: проверять хэш содержимого вместо времени изменения
+        :param (str) cache_dir: папка кэша, по умолчанию <file_name>.cache рядом с файлом
+        :return: (VacancyTable) таблица
+        """
+        directory = cache_dir or f'{file_name}.cache'
+        key = VacancyTable.get_cache_key(file_name, check_hash)
+        meta = VacancyTable.read_meta(directory)
+        compared = ('version', 'path', 'size', 'sha256') if check_hash else ('version', 'path', 'size', 'mtime_ns')
+        metrics = PipelineMetrics.active
+        if all(meta.get(name) == key[name] for name in compared):
+            try:
+                table = VacancyTable.load(directory)
+                if metrics is not None:
+                    metrics.count('cache_hits')
+                return table
+            except (OSError, ValueError, KeyError):
+                pass
+        if metrics is not None:
+            metrics.count('cache_misses')
+        table = VacancyTable.from_file(file_name)
+        try:
+            table.save(directory, key)
+        except OSError:
+            pass
+        return table
+
+    def get_salaries_in_rub(self):
+        """
+        Метод векторной конвертации зарплат в рубли, результат запоминается в таблице
+        :return: (np.ndarray) средняя зарплата каждой вакансии в рублях
+        """
+        if self.salaries is None:
+            if self.currency_rates is None:
+                rates = np.array([currency.value for currency in CurrencyToRub], dtype=np.float64)[self.currency_codes]
+            else:
+                rates = self.currency_rates.get_rates(self.currency_codes, self.years, self.months)
+            self.salaries = (np.trunc(self.salary_from) + np.trunc(self.salary_to)) / 2 * rates
+        return self.salaries
+
+    def use_rates(self, rates):
+        """
+        Метод выбора курсов валют: сбрасывает посчитанные по старым курсам зарплаты и статистику
+        :param (CurrencyRates) rates: курсы валют по месяцам, None - курсы CurrencyToRub
+        :return: (VacancyTable) self
+        """
+        self.currency_rates = rates
+        self.salaries = None
+        self.overall_data = None
+        self.rollups = None
+        return self
+
+    def get_vacancy_rows(self, vac_name):
+        """
+        Метод получения номеров строк выбранной профессии через индекс названий, без просмотра всей таблицы
+        :param (str) vac_name: название профессии
+        :return: (np.ndarray) возрастающие номера строк
+        """
+        return self.get_name_index().get_rows(vac_name)
+
+    def get_name_index(self):
+        """
+        Метод получения индекса названий, строится один раз на таблицу
+        :return: (NameIndex) индекс
+        """
+        if self.name_index is None:
+            self.name_index = NameIndex(self.names, self.name_codes)
+        return self.name_index
+
+    def get_overall_data(self):
+        """
+        Метод получения статистики по всем вакансиям, результат запоминается в таблице
+        :return: years_salary, years_count, area_salary, area_count
+        """
+        if self.overall_data is not None:
+            return self.overall_data
+        total = len(self)
+        if total == 0:
+            return {}, {}, {}, {}
+        salaries = self.get_salaries_in_rub()
+        year_min = int(self.years.min())
+        year_index = self.years - year_min
+        length = int(year_index.max()) + 1
+        years_count = np.bincount(year_index, minlength=length)
+        years_sum = np.bincount(year_index, weights=salaries, minlength=length)
+        years_salary = VacancyTable.get_means(years_sum, years_count, year_min)
+        years_count = {year_min + index: int(count) for index, count in enumerate(years_count)}
+
+        area_count = np.bincount(self.area_codes, minlength=len(self.areas))
+        area_sum = np.bincount(self.area_codes, weights=salaries, minlength=len(self.areas))
+        eligible = np.flatnonzero(area_count >= self.top_areas.get_threshold(total))
+        area_salary, area_count = self.top_areas.select(
+            ((self.areas[code], int(area_count[code]), area_sum[code] / area_count[code]) for code in eligible), total)
+
+        self.overall_data = years_salary, years_count, area_salary, area_count
+        return self.overall_data
+
+    def get_vacancy_data(self, vac_name):
+        """
+        Метод получения статистики по годам для выбранной профессии
+        :param (str) vac_name: название профессии
+        :return: years_salary_vacancy, years_count_vacancy
+        """
+        return self.get_vacancy_data_batch([vac_name])[vac_name]
+
+    def get_vacancy_data_batch(self, vac_names):
+        """
+        Метод получения статистики по годам сразу для нескольких профессий.
+        Границы лет и зарплаты в рублях считаются один раз на пакет, для каждой профессии
+        обрабатываются только её строки из индекса названий, поэтому память не зависит от числа названий
+        :param (list) vac_names: названия профессий
+        :return: (dict) {профессия: (years_salary_vacancy, years_count_vacancy)}
+        """
+        if len(self) == 0:
+            return {vac_name: ({}, {}) for vac_name in vac_names}
+        year_min = int(self.years.min())
+        length = int(self.years.max()) - year_min + 1
+        salaries = self.get_salaries_in_rub()
+        result = {}
+        for vac_name in vac_names:
+            rows = self.get_vacancy_rows(vac_name)
+            year_index = self.years[rows] - year_min
+            years_count_vacancy = np.bincount(year_index, minlength=length)
+            years_sum_vacancy = np.bincount(year_index, weights=salaries[rows], minlength=length)
+            result[vac_name] = (VacancyTable.get_means(years_sum_vacancy, years_count_vacancy, year_min),
+                                {year_min + index: int(count) for index, count in enumerate(years_count_vacancy)})
+        return result
+
+    def get_rollups(self):
+        """
+        Метод получения хранилища статистики по периодам, строится один раз на таблицу
+        :return: (RollupStore) хранилище
+        """
+        if self.rollups is None:
+            self.rollups = RollupStore(self)
+        return self.rollups
+
+    @PipelineMetrics.timed('table_data')
+    def get_data_for_table(self, vac_name):
+        """
+        Метод получения данных для таблицы
+        :param (str) vac_name: название профессии
+        :return: years_salary, years_count, years_salary_vacancy, years_count_vacancy, area_salary, area_count
+        """
+        if len(self) == 0:
+            return {}, {}, {}, {}, {}, {}
+        years_salary, years_count, area_salary, area_count = self.get_overall_data()
+        years_salary_vacancy, years_count_vacancy = self.get_vacancy_data(vac_name)
+        return years_salary, years_count, years_salary_vacancy, years_count_vacancy, area_salary, area_count
+
+    @staticmethod
+    def get_means(sums, counts, year_min):
+        """
+        Метод получения словаря средних зарплат по годам
+        :param (np.ndarray) sums: суммы зарплат по годам
+        :param (np.ndarray) counts: количества вакансий по годам
+        :param (int) year_min: первый год
+        :return: (dict) {год: средняя зарплата}
+        """
+        return {year_min + index: int(sums[index] / counts[index]) if counts[index] != 0 else 0
+                for index in range(len(counts))}
+
+
+class RollupStore:
+    """
+    Класс предагрегированной статистики по периодам времени.
+    По таблице один раз считаются количество вакансий и сумма зарплат за каждый день,
+    более крупные периоды (неделя, месяц, квартал, год) получаются сложением дневных значений.
+    Результат имеет тот же вид, что и years_* словари, поэтому подходит для Report
+
+    Attributes:
+        table (VacancyTable): таблица вакансий
+        first_day (np.datetime64): первый день периода данных
+        day_index (np.ndarray): номер дня от first_day для каждой строки таблицы
+        length (int): количество дней от первого до последнего
+        day_counts (np.ndarray): количество вакансий по дням
+        day_sums (np.ndarray): сумма зарплат в рублях по дням
+        buckets (dict): {гранулярность: (метки периодов, индекс периода для каждого дня)}
+        vacancy_days (dict): {профессия: (количества, суммы) по дням} для последних CACHE_SIZE профессий
+    """
+    GRANULARITIES = ('day', 'week', 'month', 'quarter', 'year')
+    CACHE_SIZE = 64
+
+    def __init__(self, table):
+        """
+        :param (VacancyTable) table: таблица вакансий
+        """
+        self.table = table
+        months = (table.years.astype(np.int64) - 1970) * 12 + table.months - 1
+        dates = months.astype('datetime64[M]').astype('datetime64[D]') + (table.days.astype(np.int64) - 1)
+        self.first_day = dates.min()
+        self.day_index = (dates - self.first_day).astype(np.int64)
+        self.length = int(self.day_index.max()) + 1
+        self.day_counts = np.bincount(self.day_index, minlength=self.length)
+        self.day_sums = np.bincount(self.day_index, weights=table.get_salaries_in_rub(), minlength=self.length)
+        self.buckets = {}
+        self.vacancy_days = {}
+
+    def get_buckets(self, granularity: str):
+        """
+        Метод получения разбиения дней на периоды
+        :param (str) granularity: day, week (ISO неделя), month, quarter или year
+        :return: (tuple) метки периодов по возрастанию и индекс периода для каждого дня
+        """
+        if granularity not in RollupStore.GRANULARITIES:
+            raise ValueError(f'Неизвестная гранулярность: {granularity}')
+        if granularity not in self.buckets:
+            days = (self.first_day + np.arange(self.length)).tolist()
+            if granularity == 'day':
+                labels = [day.isoformat() for day in days]
+            elif granularity == 'week':
+                labels = ['%d-W%02d' % day.isocalendar()[:2] for day in days]
+            elif granularity == 'month':
+                labels = [f'{day.year}-{day.month:02d}' for day in days]
+            elif granularity == 'quarter':
+                labels = [f'{day.year}-Q{(day.month - 1) // 3 + 1}' for day in days]
+            else:
+                labels = [day.year for day in days]
+            keys, index = np.unique(labels, return_inverse=True)
+            self.buckets[granularity] = [key.item() for key in keys], index
+        return self.buckets[granularity]
+
+    def get_vacancy_days(self, vac_name: str):
+        """
+        Метод получения дневных количеств и сумм зарплат выбранной профессии
+        :param (str) vac_name: название профессии
+        :return: (tuple) количества и суммы по дням
+        """
+        days = self.vacancy_days.pop(vac_name, None)
+        if days is None:
+            rows = self.table.get_vacancy_rows(vac_name)
+            day_index = self.day_index[rows]
+            days = (np.bincount(day_index, minlength=self.length),
+                    np.bincount(day_index, weights=self.table.get_salaries_in_rub()[rows], minlength=self.length))
+        while len(self.vacancy_days) >= RollupStore.CACHE_SIZE:
+            self.vacancy_days.pop(next(iter(self.vacancy_days), None), None)
+        self.vacancy_days[vac_name] = days
+        return days
+
+    def roll_up(self, counts, sums, granularity: str):
+        """
+        Метод сложения дневных значений в периоды
+        :param (np.ndarray) counts: количества по дням
+        :param (np.ndarray) sums: суммы зарплат по дням
+        :param (str) granularity: гранулярность
+        :return: (tuple) словари {период: средняя зарплата} и {период: количество}
+        """
+        labels, index = self.get_buckets(granularity)
+        period_counts = np.bincount(index, weights=counts, minlength=len(labels))
+        period_sums = np.bincount(index, weights=sums, minlength=len(labels))
+        salary = {label: int(period_sums[i] / period_counts[i]) if period_counts[i] != 0 else 0
+                  for i, label in enumerate(labels)}
+        count = {label: int(period_counts[i]) for i, label in enumerate(labels)}
+        return salary, count
+
+    def get_data_for_table(self, vac_name: str, granularity: str = 'month'):
+        """
+        Метод получения данных для таблицы с выбранной гранулярностью времени
+        :param (str) vac_name: название профессии
+        :param (str) granularity: day, week, month, quarter или year
+        :return: periods_salary, periods_count, periods_salary_vacancy, periods_count_vacancy, area_salary, area_count
+        """
+        periods_salary, periods_count = self.roll_up(self.day_counts, self.day_sums, granularity)
+        periods_salary_vacancy, periods_count_vacancy = self.roll_up(*self.get_vacancy_days(vac_name), granularity)
+        _, _, area_salary, area_count = self.table.get_overall_data()
+        return periods_salary, periods_count, periods_salary_vacancy, periods_count_vacancy, area_salary, area_count
+
+
+class IncrementalState:
+    """
+    Класс сохраняемого состояния статистики для дозагрузки дописанных в конец файла строк.
+    Хранит общую статистику по годам и городам, накопители по годам для каждого названия вакансии
+    и смещение первой ещё не учтённой записи, поэтому новый запуск парсит только хвост файла.
+    Если начало файла изменилось, файл стал короче или курсы валют не те, с которыми состояние строилось,
+    состояние строится заново
+
+    Attributes:
+        file_name (str): название файла
+        naming (list): заголовок csv
+        offset (int): смещение в байтах первой не учтённой записи
+        head (str): sha256 первых байт файла, по нему проверяется, что файл только дописывался
+        aggregator (StatisticsAggregator): статистика по годам и городам
+        names (dict): {название вакансии: накопители по годам}
+        tail (IncrementalState): последняя запись без перевода строки в конце файла, учитывается в get_data,
+            но не сохраняется и не сдвигает offset; None - такой записи нет
+    """
+    HEAD_SIZE = 1024 * 1024
+    VERSION = 2
+
+    def __init__(self, file_name, rates=None):
+        self.file_name = file_name
+        self.naming = None
+        self.offset = 0
+        self.head = None
+        self.aggregator = StatisticsAggregator(None, rates)
+        self.names = {}
+        self.tail = None
+
+    @staticmethod
+    def get_rates_key(rates):
+        """
+        Метод получения ключа курсов валют, по нему проверяется, что состояние строилось с теми же курсами
+        :param (CurrencyRates) rates: курсы валют по месяцам
+        :return: (str) sha256 курсов, None - курсы CurrencyToRub
+        """
+        if rates is None:
+            return None
+        return hashlib.sha256(np.int64(rates.first_month).tobytes()
+                              + np.ascontiguousarray(rates.rates, dtype=np.float64).tobytes()).hexdigest()
+
+    def add(self, vacancy):
+        """
+        Метод учёта одной вакансии
+        :param (Vacancy) vacancy: вакансия
+        """
+        self.aggregator.add(vacancy)
+        name = tuple(vacancy.name) if isinstance(vacancy.name, list) else vacancy.name
+        year, month, _ = PublishedAt.parse(vacancy.published_at)
+        currency = vacancy.salary.salary_currency
+        if self.aggregator.rates is not None:
+            currency = (currency, year, month)
+        StatisticsAggregator.add_to_accumulator(self.names.setdefault(name, {}), year, currency,
+                                                vacancy.salary.get_salary_sum())
+
+    def get_head(self):
+        """
+        Метод подсчёта sha256 начала файла (до HEAD_SIZE байт, но не дальше offset)
+        :return: (str) hex хэш
+        """
+        with open(self.file_name, 'rb') as file:
+            return hashlib.sha256(file.read(min(self.offset, IncrementalState.HEAD_SIZE))).hexdigest()
+
+    def update(self, block_size=64 * 1024 * 1024):
+        """
+        Метод учёта записей, дописанных после offset. Файл читается блоками по полным записям.
+        Последняя запись без перевода строки остаётся до следующего запуска, но если она разбирается
+        как полная строка, она учитывается в get_data (так же, как в get_data_for_table) через tail
+        :param (int) block_size: размер блока чтения
+        :return: (int) количество учтённых вакансий без tail
+        """
+        size = os.path.getsize(self.file_name)
+        if self.naming is not None and (size < self.offset or self.get_head() != self.head):
+            self.__init__(self.file_name, self.aggregator.rates)
+        if self.naming is None:
+            bounds = DataSet.get_record_bounds(self.file_name, [0])
+            if not bounds:
+                return 0
+            with open(self.file_name, 'rb') as file:
+                header = file.read(bounds[0])
+            self.naming = next(csv.reader(io.TextIOWrapper(io.BytesIO(header), encoding='utf_8_sig')))
+            self.offset = bounds[0]
+
+        total = self.aggregator.total
+        with open(self.file_name, 'rb') as file:
+            file.seek(self.offset)
+            rest = b''
+            while True:
+                block = file.read(block_size)
+                data = rest + block
+                end = DataSet.get_last_record_end(data)
+                for vacancy in DataSet.iter_chunk_vacancies(data[:end], self.naming):
+                    self.add(vacancy)
+                self.offset += end
+                rest = data[end:]
+                if not block:
+                    break
+        self.tail = None
+        if rest:
+            tail = IncrementalState(self.file_name, self.aggregator.rates)
+            try:
+                for vacancy in DataSet.iter_chunk_vacancies(rest, self.naming):
+                    tail.add(vacancy)
+            except (ValueError, csv.Error):
+                tail = None
+            if tail is not None and tail.aggregator.total:
+                self.tail = tail
+        self.head = self.get_head()
+        return self.aggregator.total - total
+
+    def get_data(self, vac_name):
+        """
+        Метод получения данных для таблицы по накопленному состоянию
+        :param (str) vac_name: название нужнуй вакансии
+        :return: те же данные, что и InputConnect.get_data_for_table
+        """
+        aggregator = StatisticsAggregator(vac_name, self.aggregator.rates)
+        aggregator.total = self.aggregator.total
+        aggregator.years = self.aggregator.years
+        aggregator.areas = self.aggregator.areas
+        states = (self,)
+        if self.tail is not None:
+            aggregator.years = {}
+            aggregator.areas = {}
+            aggregator.total = 0
+            aggregator.merge(self.aggregator).merge(self.tail.aggregator)
+            states = (self, self.tail)
+        for state in states:
+            for name, years in state.names.items():
+                if vac_name in name:
+                    StatisticsAggregator.merge_accumulators(aggregator.years_vacancy, years)
+        return aggregator.get_data()
+
+    @staticmethod
+    def dump_accumulators(accumulators: dict):
+        """
+        Метод перевода накопителей в список для json
+        :param (dict) accumulators: накопители вида {ключ: [количество, {валюта: сумма}]}
+        :return: (list) [[ключ, количество, [[валюта, сумма], ...]], ...]
+        """
+        return [[key, count, [[currency, salary_sum] for currency, salary_sum in sums.items()]]
+                for key, (count, sums) in accumulators.items()]
+
+    @staticmethod
+    def load_accumulators(items: list):
+        """
+        Метод обратного перевода накопителей из json
+        :param (list) items: результат dump_accumulators
+        :return: (dict) накопители
+        """
+        return {key: [count, {tuple(currency) if isinstance(currency, list) else currency: salary_sum
+                              for currency, salary_sum in sums}]
+                for key, count, sums in items}
+
+    def save(self, state_file):
+        """
+        Метод сохранения состояния в json, файл заменяется атомарно
+        :param (str) state_file: файл состояния
+        """
+        state = {'version': IncrementalState.VERSION, 'file_name': os.path.abspath(self.file_name),
+                 'rates': IncrementalState.get_rates_key(self.aggregator.rates),
+                 'naming': self.naming, 'offset': self.offset,
+                 'head': self.head, 'total': self.aggregator.total,
+                 'years': IncrementalState.dump_accumulators(self.aggregator.years),
+                 'areas': IncrementalState.dump_accumulators(self.aggregator.areas),
+                 'names': [[list(name) if isinstance(name, tuple) else name,
+                            IncrementalState.dump_accumulators(years)] for name, years in self.names.items()]}
+        temp_file = f'{state_file}.{os.getpid()}.tmp'
+        with open(temp_file, 'w', encoding='utf_8') as file:
+            json.dump(state, file, ensure_ascii=False)
+        os.replace(temp_file, state_file)
+
+    @staticmethod
+    def load(state_file, file_name, rates=None):
+        """
+        Метод загрузки состояния. Если файла состояния нет, он от другого файла, другой версии
+        или построен с другими курсами валют, возвращается пустое состояние
+        :param (str) state_file: файл состояния
+        :param (str) file_name: название файла с вакансиями
+        :param (CurrencyRates) rates: курсы валют по месяцам, те же, с которыми состояние создавалось
+        :return: (IncrementalState) состояние
+        """
+        result = IncrementalState(file_name, rates)
+        try:
+            with open(state_file, encoding='utf_8') as file:
+                state = json.load(file)
+        except (OSError, ValueError):
+            return result
+        if state.get('version') != IncrementalState.VERSION or state.get('file_name') != os.path.abspath(file_name) \
+                or state.get('rates') != IncrementalState.get_rates_key(rates):
+            return result
+        result.naming = state['naming']
+        result.offset = state['offset']
+        result.head = state['head']
+        result.aggregator.total = state['total']
+        result.aggregator.years = IncrementalState.load_accumulators(state['years'])
+        result.aggregator.areas = IncrementalState.load_accumulators(state['areas'])
+        result.names = {tuple(name) if isinstance(name, list) else name: IncrementalState.load_accumulators(years)
+                        for name, years in state['names']}
+        return result
 
 
 class InputConnect:
@@ -127,12 +1590,13 @@ class InputConnect:
         file_name = input('Введите название файла: ')
         vac_name = input('Введите название профессии: ')
         years_salary, years_count, years_salary_vacancy, years_count_vacancy, area_salary, area_count \
-            = InputConnect.get_data_for_table(DataSet(file_name), vac_name)
+            = VacancyTable.from_cache(file_name).get_data_for_table(vac_name)
         InputConnect\
             .show_data(years_salary, years_count, years_salary_vacancy, years_count_vacancy, area_salary, area_count)
         return years_salary, years_count, years_salary_vacancy, years_count_vacancy, area_salary, area_count, vac_name
 
     @staticmethod
+    @PipelineMetrics.timed('get_data_for_table')
     def get_data_for_table(dataset, vac_name):
         """
         Метод получения данных из таблицы
@@ -146,53 +1610,125 @@ class InputConnect:
             (int[]) area_salary: средняя зарплата
             (int[]) area_count: общее количество зп
         """
-        vacancies = dataset.vacancies_objects
-        years = set()
-        for item in vacancies:
-            years.add(int(datetime.strptime(item.published_at, '%Y-%m-%dT%H:%M:%S%z').strftime("%Y")))
-        years = sorted(list(years))
-        years = list(range(min(years), max(years) + 1))
+        return InputConnect.get_data_for_stream(dataset.vacancies_objects, vac_name)
 
-        years_salary = {year: [] for year in years}
-        years_count = {year: 0 for year in years}
-        years_salary_vacancy = {year: [] for year in years}
-        years_count_vacancy = {year: 0 for year in years}
+    @staticmethod
+    def get_data_for_stream(vacancies, vac_name, rates=None):
+        """
+        Метод получения данных за один проход по итератору вакансий.
+        Хранит только суммы и количества по годам и городам, поэтому память не зависит от числа строк
+        :param vacancies: итератор вакансий (например, DataSet(file_name, stream=True).vacancies_objects)
+        :param vac_name: название нужнуй вакансии
+        :param (CurrencyRates) rates: курсы валют по месяцам, по умолчанию CurrencyToRub
+        :return: те же данные, что и get_data_for_table
+        """
+        return InputConnect.aggregate_stream(vacancies, vac_name, rates).get_data()
 
+    @staticmethod
+    @PipelineMetrics.timed('aggregate_stream')
+    def aggregate_stream(vacancies, vac_name, rates=None, quantiles=False, top_areas=None):
+        """
+        Метод агрегации итератора вакансий за один проход
+        :param vacancies: итератор вакансий
+        :param vac_name: название нужнуй вакансии
+        :param (CurrencyRates) rates: курсы валют по месяцам, по умолчанию CurrencyToRub
+        :param (bool) quantiles: считать скетчи квантилей
+        :param (TopAreas) top_areas: настройки рейтинга городов, по умолчанию 10 городов с долей от 1%
+        :return: (StatisticsAggregator) результат, данные для таблицы - get_data(), квантили - get_quantiles()
+        """
+        aggregator = StatisticsAggregator(vac_name, rates, quantiles, top_areas)
         for item in vacancies:
-            formatt = int(datetime.strptime(item.published_at, '%Y-%m-%dT%H:%M:%S%z').strftime("%Y"))
-            years_salary[formatt].append(item.salary.get_salary_in_rub())
-            years_count[formatt] += 1
-            if vac_name in item.name:
-                years_salary_vacancy[formatt].append(item.salary.get_salary_in_rub())
-                years_count_vacancy[formatt] += 1
-
-        years_salary = {key: int(sum(value) / len(value)) if len(value) != 0 else 0
-                        for key, value in years_salary.items()}
-        years_salary_vacancy = {key: int(sum(value) / len(value)) if len(value) != 0 else 0
-                                for key, value in years_salary_vacancy.items()}
-
-        area = {}
-        for item in vacancies:
-            if item.area_name in area:
-                area[item.area_name].append(item.salary.get_salary_in_rub())
-            else:
-                area[item.area_name] = [item.salary.get_salary_in_rub()]
+            aggregator.add(item)
+        return aggregator
+
+    @staticmethod
+    def get_data_parallel(file_name, vac_name, workers=None, chunk_size=64 * 1024 * 1024, rates=None):
+        """
+        Метод получения данных с параллельным парсингом файла, см. aggregate_parallel
+        :param (str) file_name: название файла
+        :param (str) vac_name: название нужнуй вакансии
+        :param (int) workers: количество процессов, по умолчанию os.cpu_count()
+        :param (int) chunk_size: желаемый размер диапазона в байтах
+        :param (CurrencyRates) rates: курсы валют по месяцам, по умолчанию CurrencyToRub
+        :return: те же данные, что и get_data_for_table
+        """
+        return InputConnect.aggregate_parallel(file_name, vac_name, workers, chunk_size, rates).get_data()
 
-        area_list = area.items()
-        area_list = [item for item in area_list if len(item[1]) >= int(len(vacancies) / 100)]
-        area_list2 = [item for item in area_list if len(item[1]) >= int(len(vacancies) / 100)]
-        area_list = sorted(area_list, key=lambda item: sum(item[1]) / len(item[1]), reverse=True)
-        area_salary = {item[0]: int(sum(item[1]) / len(item[1])) for item in area_list[0: min(len(area_list), 10)]}
+    @staticmethod
+    @PipelineMetrics.timed('aggregate_parallel')
+    def aggregate_parallel(file_name, vac_name, workers=None, chunk_size=64 * 1024 * 1024, rates=None,
+                           quantiles=False, top_areas=None):
+        """
+        Метод агрегации файла с параллельным парсингом.
+        Файл делится на диапазоны байт по границам записей, каждый диапазон парсится и агрегируется
+        в отдельном процессе, частичные результаты сливаются по порядку. Результат совпадает с get_data_for_stream;
+        для файла без строк данных возвращается пустой результат, процесс не завершается
+        :param (str) file_name: название файла
+        :param (str) vac_name: название нужнуй вакансии
+        :param (int) workers: количество процессов, по умолчанию os.cpu_count()
+        :param (int) chunk_size: желаемый размер диапазона в байтах
+        :param (CurrencyRates) rates: курсы валют по месяцам, по умолчанию CurrencyToRub
+        :param (bool) quantiles: считать скетчи квантилей
+        :param (TopAreas) top_areas: настройки рейтинга городов, по умолчанию 10 городов с долей от 1%
+        :return: (StatisticsAggregator) результат, данные для таблицы - get_data(), квантили - get_quantiles()
+        """
+        workers = workers or os.cpu_count() or 1
+        aggregator = StatisticsAggregator(vac_name, rates, quantiles, top_areas)
+        size = os.path.getsize(file_name)
+        if PipelineMetrics.active is not None:
+            PipelineMetrics.active.count('bytes_read', size)
+        chunk_count = max(workers, -(-size // chunk_size))
+        bounds = DataSet.get_record_bounds(file_name, [size * index // chunk_count for index in range(chunk_count)])
+        if not bounds or bounds[0] >= size:
+            return aggregator
+        with open(file_name, 'rb') as file:
+            naming = next(csv.reader(io.TextIOWrapper(io.BytesIO(file.read(bounds[0])), encoding='utf_8_sig')))
+        starts = bounds
+        ends = bounds[1:] + [size]
 
-        area_list2 = sorted(area_list2, key=lambda item: len(item[1]) / len(vacancies), reverse=True)
-        area_count = {item[0]: round(len(item[1]) / len(vacancies), 4)
-                      for item in area_list2[0: min(len(area_list2), 10)]}
+        if workers == 1:
+            partials = map(DataSet.aggregate_chunk, repeat(file_name), starts, ends, repeat(naming), repeat(vac_name),
+                           repeat(rates), repeat(quantiles))
+            for partial in partials:
+                aggregator.merge(partial)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                for partial in executor.map(DataSet.aggregate_chunk, repeat(file_name), starts, ends,
+                                            repeat(naming), repeat(vac_name), repeat(rates), repeat(quantiles)):
+                    aggregator.merge(partial)
+        return aggregator
 
-        return years_salary, years_count, years_salary_vacancy, years_count_vacancy, area_salary, area_count
+    @staticmethod
+    @PipelineMetrics.timed('get_data_incremental')
+    def get_data_incremental(file_name, vac_name, state_file=None, rates=None):
+        """
+        Метод получения данных с дозагрузкой: учитываются только строки, дописанные с прошлого запуска
+        :param (str) file_name: название файла
+        :param (str) vac_name: название нужнуй вакансии
+        :param (str) state_file: файл состояния, по умолчанию <file_name>.state.json
+        :param (CurrencyRates) rates: курсы валют по месяцам, по умолчанию CurrencyToRub
+        :return: те же данные, что и get_data_for_table
+        """
+        return InputConnect.get_state_incremental(file_name, state_file, rates).get_data(vac_name)
+
+    @staticmethod
+    def get_state_incremental(file_name, state_file=None, rates=None):
+        """
+        Метод загрузки состояния, учёта дописанных строк и сохранения состояния
+        :param (str) file_name: название файла
+        :param (str) state_file: файл состояния, по умолчанию <file_name>.state.json
+        :param (CurrencyRates) rates: курсы валют по месяцам, по умолчанию CurrencyToRub
+        :return: (IncrementalState) обновлённое состояние, данные по профессии - get_data(vac_name)
+        """
+        state_file = state_file or f'{file_name}.state.json'
+        state = IncrementalState.load(state_file, file_name, rates)
+        state.update()
+        state.save(state_file)
+        return state
 
     @staticmethod
     def show_data(years_salary: dict, years_count: dict, years_salary_vacancy: dict, years_count_vacancy: dict,
-                  area_salary: dict, area_count: dict):
+                  area_salary: dict, area_count: dict, quantiles: dict = None):
         """
         Метод вывода данных на консоль
         :param (dict) years_salary: годовые зарплата
@@ -201,6 +1737,7 @@ class InputConnect:
         :param (dict) years_count_vacancy: количество выбранной вакансии по годам
         :param (dict) area_salary: средняя зарплата
         :param (dict) area_count: общее количество зп
+        :param (dict) quantiles: квантили зарплат из StatisticsAggregator.get_quantiles
         """
         print(f"Динамика уровня зарплат по годам: {years_salary}")
         print(f"Динамика количества вакансий по годам: {years_count}")
@@ -208,15 +1745,70 @@ class InputConnect:
         print(f"Динамика количества вакансий по годам для выбранной профессии: {years_count_vacancy}")
         print(f"Уровень зарплат по городам (в порядке убывания): {area_salary}")
         print(f"Доля вакансий по городам (в порядке убывания): {area_count}")
+        if quantiles:
+            print(f"Квантили зарплат по годам: {quantiles['years']}")
+            print(f"Квантили зарплат по годам для выбранной профессии: {quantiles['years_vacancy']}")
+            print(f"Квантили зарплат по городам (в порядке убывания медианы): {quantiles['areas']}")
+
+
+class WeasyprintBackend:
+    """
+    Бэкенд pdf на weasyprint: html рендерится внутри процесса, без запуска внешних программ
+    """
+    def __init__(self):
+        from weasyprint import HTML
+        self.html_class = HTML
+
+    def write(self, html: str, file_name: str):
+        """
+        Метод записи html в pdf
+        :param (str) html: html отчёта
+        :param (str) file_name: путь к pdf
+        """
+        self.html_class(string=html).write_pdf(file_name)
+
+
+class PdfkitBackend:
+    """
+    Бэкенд pdf на pdfkit + wkhtmltopdf, запускает wkhtmltopdf на каждый отчёт.
+    Путь к wkhtmltopdf берётся из аргумента, переменной окружения WKHTMLTOPDF или PATH
+    """
+    WINDOWS_PATH = r'C:\Program Files\wkhtmltopdf\bin\wkhtmltopdf.exe'
+
+    def __init__(self, wkhtmltopdf: str = None):
+        import pdfkit
+        self.pdfkit = pdfkit
+        wkhtmltopdf = wkhtmltopdf or os.environ.get('WKHTMLTOPDF') or shutil.which('wkhtmltopdf') \
+            or PdfkitBackend.WINDOWS_PATH
+        self.config = pdfkit.configuration(wkhtmltopdf=wkhtmltopdf)
+
+    def write(self, html: str, file_name: str):
+        """
+        Метод записи html в pdf
+        :param (str) html: html отчёта
+        :param (str) file_name: путь к pdf
+        """
+        self.pdfkit.from_string(html, file_name, configuration=self.config)
 
 
 class Report:
     """
     Класс создания нужного репорта
     """
+    excel_styles = None
+    QUANTILES_HEADER = ["Группа", "Год / город", "25-й перцентиль", "Медиана", "75-й перцентиль", "90-й перцентиль"]
+    pyplot = None
+    image_cache = {}
+    IMAGE_CACHE_SIZE = 32
+    template = None
+    pdf_backends = {}
+
     @staticmethod
+    @PipelineMetrics.timed('generate_excel')
     def generate_excel(years_salary: dict, years_count: dict, years_salary_vacancy: dict,
-                       years_count_vacancy: dict, area_salary: dict, area_count: dict, vacancy_name: str):
+                       years_count_vacancy: dict, area_salary: dict, area_count: dict, vacancy_name: str,
+                       output_dir: str = '.',
+                       quantiles: dict = None):
         """
         Метод создания excel выборки
         :param (dict) years_salary: годовые зарплата
@@ -226,55 +1818,106 @@ class Report:
         :param (dict) area_salary: средняя зарплата
         :param (dict) area_count: общее количество зп
         :param (str) vacancy_name: название требуемой вакансии
+        :param (str) output_dir: папка для результата
+        :param (dict) quantiles: квантили зарплат из StatisticsAggregator.get_quantiles, добавляются отдельным листом
+        """
+        from openpyxl import Workbook
+        from openpyxl.styles.numbers import FORMAT_PERCENTAGE_00
+        wb = Workbook(write_only=True)
+        header_year = ["Год", "Средняя зарплата", f"Средняя зарплада - {vacancy_name}", "Количество вакансий",
+                       f"Количество вакансий - {vacancy_name}"]
+        Report.write_sheet(wb, "Статистика по годам", lambda: chain(
+            [header_year],
+            ([year, value, years_salary_vacancy[year], years_count[year], years_count_vacancy[year]]
+             for year, value in years_salary.items())))
+
+        header_city = ["Город", "Уровень зарплат", None, "Город", "Доля вакансий"]
+        Report.write_sheet(wb, 'Статистика по городам', lambda: chain(
+            [header_city],
+            ([*(salary_item or (None, None)), None, *(count_item or (None, None))]
+             for salary_item, count_item in zip_longest(area_salary.items(), area_count.items()))),
+                           number_formats={4: FORMAT_PERCENTAGE_00})
+
+        if quantiles:
+            Report.write_sheet(wb, 'Квантили зарплат', lambda: chain(
+                [Report.QUANTILES_HEADER], Report.get_quantile_rows(quantiles, vacancy_name)))
+
+        wb.save(os.path.join(output_dir, 'report.xlsx'))
+
+    @staticmethod
+    def get_quantile_rows(quantiles: dict, vacancy_name: str):
+        """
+        Генератор строк таблицы квантилей: группа, год или город, p25, медиана, p75, p90
+        :param (dict) quantiles: квантили зарплат из StatisticsAggregator.get_quantiles
+        :param (str) vacancy_name: название требуемой вакансии
         """
-        wb = Workbook()
-        del wb["Sheet"]
-        sheet = wb.create_sheet("Статистика по годам")
-        side_thin = Side(border_style="thin", color="000000")
-        sheet = Report.set_value_in_cell(sheet, "A1", "Год", side_thin)
-        sheet = Report.set_value_in_cell(sheet, "B1", "Средняя зарплата", side_thin)
-        sheet = Report.set_value_in_cell(sheet, "C1", f"Средняя зарплада - {vacancy_name}", side_thin)
-        sheet = Report.set_value_in_cell(sheet, "D1", "Количество вакансий", side_thin)
-        sheet = Report.set_value_in_cell(sheet, "E1", f"Количество вакансий - {vacancy_name}", side_thin)
-        sheet = Report.set_bold_font(sheet, "A1", "B1", "C1", "D1", "E1")
-
-        for row, (year, value) in enumerate(years_salary.items(), start=2):
-            sheet = Report.set_value_in_cell(sheet, f"A{row}", year, side_thin)
-            sheet = Report.set_value_in_cell(sheet, f"B{row}", value, side_thin)
-            sheet = Report.set_value_in_cell(sheet, f"C{row}", years_salary_vacancy[year], side_thin)
-            sheet = Report.set_value_in_cell(sheet, f"D{row}", years_count[year], side_thin)
-            sheet = Report.set_value_in_cell(sheet, f"E{row}", years_count_vacancy[year], side_thin)
-
-        for column_cells in sheet.columns:
-            length = max(len(Report.try_parse(cell.value)) for cell in column_cells)
-            sheet.column_dimensions[column_cells[0].column_letter].width = length + 2
-
-        sheet = wb.create_sheet('Статистика по городам')
-        sheet = Report.set_value_in_cell(sheet, "A1", "Город", side_thin)
-        sheet = Report.set_value_in_cell(sheet, "B1", "Уровень зарплат", side_thin)
-        sheet = Report.set_value_in_cell(sheet, "D1", "Город", side_thin)
-        sheet = Report.set_value_in_cell(sheet, "E1", "Доля вакансий", side_thin)
-        sheet = Report.set_bold_font(sheet, "A1", "B1", "C1", "D1", "E1")
-
-        for row, (year, value) in enumerate(area_salary.items(), start=2):
-            sheet = Report.set_value_in_cell(sheet, f"A{row}", year, side_thin)
-            sheet = Report.set_value_in_cell(sheet, f"B{row}", value, side_thin)
-        for row, (year, value) in enumerate(area_count.items(), start=2):
-            sheet = Report.set_value_in_cell(sheet, f"D{row}", year, side_thin)
-            sheet = Report.set_value_in_cell(sheet, f"E{row}", value, side_thin)
-            sheet[f"E{row}"].number_format = FORMAT_PERCENTAGE_00
-
-        for column_cells in sheet.columns:
-            length = max(len(Report.try_parse(cell.value)) for cell in column_cells)
-            sheet.column_dimensions[column_cells[0].column_letter].width = length + 2
-
-        wb.save('report.xlsx')
+        for group, title in (('years', 'По годам'), ('years_vacancy', f'По годам - {vacancy_name}'),
+                             ('areas', 'По городам')):
+            for key, values in quantiles[group].items():
+                yield [title, key, *(values[name] for name, _ in QuantileSketch.QUANTILES)]
 
     @staticmethod
+    @PipelineMetrics.timed('generate_image')
     def generate_image(years_salary: dict, years_count: dict, years_salary_vacancy: dict,
-                       years_count_vacancy: dict, area_salary: dict, area_count: dict, vacancy_name: str):
+                       years_count_vacancy: dict, area_salary: dict, area_count: dict, vacancy_name: str,
+                       output_dir: str = '.'):
+        """
+        Метод генерации изображения по данным, если данные не менялись, существующий graph.png не перерисовывается
+        :param (dict) years_salary: годовые зарплата
+        :param (dict) years_count: количество лет
+        :param (dict) years_salary_vacancy: зарплаты по выбранной вакансии
+        :param (dict) years_count_vacancy: количество выбранной вакансии по годам
+        :param (dict) area_salary: средняя зарплата
+        :param (dict) area_count: общее количество зп
+        :param (str) vacancy_name: название требуемой вакансии
+        :param (str) output_dir: папка для результата
+        :return: (str) путь к изображению
+        """
+        image_file = os.path.join(output_dir, 'graph.png')
+        key_file = f'{image_file}.sha256'
+        key = Report.get_image_key(years_salary, years_count, years_salary_vacancy, years_count_vacancy,
+                                   area_salary, area_count, vacancy_name, 'png')
+        if os.path.exists(image_file) and os.path.exists(key_file):
+            with open(key_file, encoding='utf_8') as file:
+                if file.read() == key:
+                    return image_file
+        image = Report.render_image(years_salary, years_count, years_salary_vacancy, years_count_vacancy,
+                                    area_salary, area_count, vacancy_name, 'png')
+        with open(image_file, 'wb') as file:
+            file.write(image)
+        with open(key_file, 'w', encoding='utf_8') as file:
+            file.write(key)
+        return image_file
+
+    @staticmethod
+    def get_pyplot():
+        """
+        Метод ленивого импорта pyplot с неинтерактивным бэкендом Agg, импорт выполняется при первом графике
+        :return: модуль matplotlib.pyplot
+        """
+        if Report.pyplot is None:
+            import matplotlib
+            matplotlib.use('Agg')
+            import matplotlib.pyplot as pyplot
+            Report.pyplot = pyplot
+        return Report.pyplot
+
+    @staticmethod
+    def get_image_key(*args) -> str:
+        """
+        Метод получения ключа графика: sha256 от входных данных в порядке их следования
+        :param args: данные графика
+        :return: (str) hex хэш
+        """
+        return hashlib.sha256(repr(args).encode('utf_8')).hexdigest()
+
+    @staticmethod
+    def render_image(years_salary: dict, years_count: dict, years_salary_vacancy: dict,
+                     years_count_vacancy: dict, area_salary: dict, area_count: dict, vacancy_name: str,
+                     image_format: str = 'png'):
         """
-        Метод генерации изображения по данным
+        Метод отрисовки графиков в память. Результат запоминается по хэшу входных данных,
+        поэтому повторный вызов с теми же данными не рисует график заново
         :param (dict) years_salary: годовые зарплата
         :param (dict) years_count: количество лет
         :param (dict) years_salary_vacancy: зарплаты по выбранной вакансии
@@ -282,9 +1925,17 @@ class Report:
         :param (dict) area_salary: средняя зарплата
         :param (dict) area_count: общее количество зп
         :param (str) vacancy_name: название требуемой вакансии
+        :param (str) image_format: png или svg
+        :return: (bytes) содержимое изображения
         """
+        key = Report.get_image_key(years_salary, years_count, years_salary_vacancy, years_count_vacancy,
+                                   area_salary, area_count, vacancy_name, image_format)
+        if key in Report.image_cache:
+            return Report.image_cache[key]
+
+        plt = Report.get_pyplot()
         width_const = 0.4
-        _, work_item = plt.subplots(2, 2)
+        figure, work_item = plt.subplots(2, 2)
         X_axis = np.arange(len(years_salary.keys()))
         work_item[0, 0] = Report.set_graphic(work_item[0, 0], X_axis, width_const, "средняя з/п", f"з/п {vacancy_name}",
                                              years_salary, years_salary_vacancy, "Уровень зарплат по годам")
@@ -309,12 +1960,22 @@ class Report:
         work_item[1, 1].pie(list(area_count_dic.values()), labels=list(area_count_dic.keys()), textprops={'fontsize': 6})
         work_item[1, 1].axis('scaled')
         work_item[1, 1].set_title("Доля вакансий по городам")
-        plt.tight_layout()
-        plt.savefig('graph.png', dpi=300)
+        figure.tight_layout()
+        buffer = io.BytesIO()
+        figure.savefig(buffer, format=image_format, dpi=300)
+        plt.close(figure)
+
+        if len(Report.image_cache) >= Report.IMAGE_CACHE_SIZE:
+            del Report.image_cache[next(iter(Report.image_cache))]
+        Report.image_cache[key] = buffer.getvalue()
+        return Report.image_cache[key]
 
     @staticmethod
+    @PipelineMetrics.timed('generate_pdf')
     def generate_pdf(years_salary: dict, years_count: dict, years_salary_vacancy: dict,
-                       years_count_vacancy: dict, area_salary: dict, area_count: dict, vacancy_name: str):
+                       years_count_vacancy: dict, area_salary: dict, area_count: dict, vacancy_name: str,
+                     output_dir: str = '.',
+                     image: bytes = None, image_format: str = 'png', backend=None, quantiles: dict = None):
         """
         Метод генерации pdf по выборке
         :param (dict) years_salary: годовые зарплата
@@ -324,24 +1985,225 @@ class Report:
         :param (dict) area_salary: средняя зарплата
         :param (dict) area_count: общее количество зп
         :param (str) vacancy_name: название требуемой вакансии
+        :param (str) output_dir: папка для результата
+        :param (bytes) image: готовый график, если не передан - рисуется через render_image
+        :param (str) image_format: формат графика: png или svg
+        :param backend: бэкенд pdf, по умолчанию Report.get_pdf_backend()
+        :param (dict) quantiles: квантили зарплат из StatisticsAggregator.get_quantiles
+        :return: (str) путь к pdf
         """
-        area_count = {x[0]: str(f'{x[1] * 100:,.2f}%').replace('.', ',') for x in area_count.items()}
+        if image is None:
+            image = Report.render_image(years_salary, years_count, years_salary_vacancy, years_count_vacancy,
+                                        area_salary, area_count, vacancy_name, image_format)
+        html = Report.render_html(years_salary, years_count, years_salary_vacancy, years_count_vacancy,
+                                  area_salary, area_count, vacancy_name, image, image_format, quantiles)
+        pdf_file = os.path.join(output_dir, 'report.pdf')
+        (backend or Report.get_pdf_backend()).write(html, pdf_file)
+        return pdf_file
+
+    @staticmethod
+    def generate_pdf_batch(reports, backend=None, image_format: str = 'png'):
+        """
+        Метод генерации нескольких pdf одним загруженным шаблоном и одним экземпляром бэкенда
+        :param reports: итератор (data, vacancy_name, output_dir), где data - шесть словарей статистики
+        :param backend: бэкенд pdf, по умолчанию Report.get_pdf_backend()
+        :param (str) image_format: формат графика: png или svg
+        :return: (list) пути к pdf
+        """
+        backend = backend or Report.get_pdf_backend()
+        return [Report.generate_pdf(*data, vacancy_name, output_dir=output_dir, image_format=image_format,
+                                    backend=backend)
+                for data, vacancy_name, output_dir in reports]
 
-        image_file = "graph.png"
-        env = Environment(loader=FileSystemLoader('.'))
-        template = env.get_template("index.html")
+    @staticmethod
+    def render_html(years_salary: dict, years_count: dict, years_salary_vacancy: dict,
+                    years_count_vacancy: dict, area_salary: dict, area_count: dict, vacancy_name: str,
+                    image: bytes, image_format: str = 'png', quantiles: dict = None):
+        """
+        Метод заполнения html шаблона отчёта, график встраивается как data URI
+        :param (dict) years_salary: годовые зарплата
+        :param (dict) years_count: количество лет
+        :param (dict) years_salary_vacancy: зарплаты по выбранной вакансии
+        :param (dict) years_count_vacancy: количество выбранной вакансии по годам
+        :param (dict) area_salary: средняя зарплата
+        :param (dict) area_count: общее количество зп
+        :param (str) vacancy_name: название требуемой вакансии
+        :param (bytes) image: график
+        :param (str) image_format: формат графика: png или svg
+        :param (dict) quantiles: квантили зарплат из StatisticsAggregator.get_quantiles
+        :return: (str) html
+        """
+        area_count = {x[0]: str(f'{x[1] * 100:,.2f}%').replace('.', ',') for x in area_count.items()}
+        mime_type = 'image/svg+xml' if image_format == 'svg' else f'image/{image_format}'
+        image_file = f'data:{mime_type};base64,{base64.b64encode(image).decode("ascii")}'
         header_year = ["Год", "Средняя зарплата", f"Средняя зарплата - {vacancy_name}", "Количество вакансий",
                        f"Количество вакансий - {vacancy_name}"]
         header_city = ["Город", "Уровень зарплат", "Город", "Доля вакансий"]
-        pdf_template = template.render({'years_salary': years_salary,
-                                        'years_count': years_count,
-                                        'years_salary_vacancy': years_salary_vacancy,
-                                        'years_count_vacancy': years_count_vacancy, 'area_salary': area_salary,
-                                        'area_count': area_count, 'header_year': header_year,
-                                        'header_city': header_city, 'image_file': image_file,
-                                        'vacancy_name': vacancy_name})
-        config = pdfkit.configuration(wkhtmltopdf=r'C:\Program Files\wkhtmltopdf\bin\wkhtmltopdf.exe')
-        pdfkit.from_string(pdf_template, 'report.pdf', configuration=config)
+        return Report.get_template().render({'years_salary': years_salary,
+                                             'years_count': years_count,
+                                             'years_salary_vacancy': years_salary_vacancy,
+                                             'years_count_vacancy': years_count_vacancy, 'area_salary': area_salary,
+                                             'area_count': area_count, 'header_year': header_year,
+                                             'header_city': header_city, 'image_file': image_file,
+                                             'vacancy_name': vacancy_name,
+                                             'header_quantiles': Report.QUANTILES_HEADER,
+                                             'quantile_rows': list(Report.get_quantile_rows(quantiles, vacancy_name))
+                                             if quantiles else []})
+
+    @staticmethod
+    def get_template():
+        """
+        Метод получения скомпилированного шаблона index.html, шаблон загружается один раз на процесс
+        :return: шаблон jinja2
+        """
+        if Report.template is None:
+            from jinja2 import Environment, FileSystemLoader
+            env = Environment(loader=FileSystemLoader(os.path.dirname(os.path.abspath(__file__))))
+            Report.template = env.get_template("index.html")
+        return Report.template
+
+    @staticmethod
+    def get_pdf_backend(name: str = None):
+        """
+        Метод получения бэкенда pdf, экземпляр создаётся один раз на процесс.
+        Имя берётся из аргумента или переменной окружения PDF_BACKEND: weasyprint или pdfkit.
+        По умолчанию используется weasyprint (рендер внутри процесса), если он установлен, иначе pdfkit
+        :param (str) name: имя бэкенда
+        :return: бэкенд с методом write(html, file_name)
+        """
+        name = name or os.environ.get('PDF_BACKEND')
+        if name is None:
+            try:
+                import weasyprint
+                name = 'weasyprint'
+            except ImportError:
+                name = 'pdfkit'
+        if name not in Report.pdf_backends:
+            if name == 'weasyprint':
+                Report.pdf_backends[name] = WeasyprintBackend()
+            elif name == 'pdfkit':
+                Report.pdf_backends[name] = PdfkitBackend()
+            else:
+                raise ValueError(f'Неизвестный бэкенд pdf: {name}')
+        return Report.pdf_backends[name]
+
+    @staticmethod
+    def generate_reports(data: tuple, vacancy_name: str, output_dir: str, formats=('excel', 'image', 'pdf'),
+                         quantiles: dict = None):
+        """
+        Метод генерации всех выбранных отчётов для одной профессии в свою папку
+        :param (tuple) data: шесть словарей статистики в порядке аргументов generate_excel
+        :param (str) vacancy_name: название требуемой вакансии
+        :param (str) output_dir: папка для результата, создаётся при необходимости
+        :param formats: какие отчёты генерировать: excel, image, pdf
+        :param (dict) quantiles: квантили зарплат из StatisticsAggregator.get_quantiles, попадают в excel и pdf
+        :return: (str) папка с результатом
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        if 'excel' in formats:
+            Report.generate_excel(*data, vacancy_name, output_dir=output_dir, quantiles=quantiles)
+        if 'image' in formats:
+            Report.generate_image(*data, vacancy_name, output_dir=output_dir)
+        if 'pdf' in formats:
+            Report.generate_pdf(*data, vacancy_name, output_dir=output_dir, quantiles=quantiles)
+        return output_dir
+
+    @staticmethod
+    def generate_batch(table, vacancy_names, output_dir='reports', workers=None, formats=('excel', 'image', 'pdf')):
+        """
+        Метод пакетной генерации отчётов для списка профессий.
+        Общая статистика по годам и городам считается один раз, для каждой профессии считается
+        только её статистика по годам. Отчёты рисуются параллельно в пуле процессов,
+        каждая профессия - в свою папку output_dir/<профессия>, совпавшие имена папок получают суффикс _2, _3, ...
+        :param (VacancyTable) table: таблица вакансий
+        :param (list) vacancy_names: названия профессий
+        :param (str) output_dir: корневая папка для результатов
+        :param (int) workers: количество процессов, по умолчанию os.cpu_count()
+        :param formats: какие отчёты генерировать: excel, image, pdf
+        :return: (dict) {профессия: папка с результатом}
+        """
+        years_salary, years_count, area_salary, area_count = table.get_overall_data()
+        vacancies_data = table.get_vacancy_data_batch(vacancy_names)
+        return Report.generate_batch_data(
+            {vacancy_name: (years_salary, years_count, years_salary_vacancy, years_count_vacancy, area_salary,
+                            area_count)
+             for vacancy_name, (years_salary_vacancy, years_count_vacancy) in vacancies_data.items()},
+            output_dir, workers, formats)
+
+    @staticmethod
+    def generate_batch_data(reports: dict, output_dir='reports', workers=None, formats=('excel', 'image', 'pdf'),
+                            quantiles: dict = None):
+        """
+        Метод пакетной генерации отчётов по уже посчитанной статистике (например, из IncrementalState).
+        Отчёты рисуются параллельно в пуле процессов, каждая профессия - в свою папку
+        :param (dict) reports: {профессия: шесть словарей статистики в порядке аргументов generate_excel}
+        :param (str) output_dir: корневая папка для результатов
+        :param (int) workers: количество процессов, по умолчанию os.cpu_count()
+        :param formats: какие отчёты генерировать: excel, image, pdf
+        :param (dict) quantiles: {профессия: квантили зарплат из StatisticsAggregator.get_quantiles}
+        :return: (dict) {профессия: папка с результатом}
+        """
+        quantiles = quantiles or {}
+        used = set()
+        directories = {vacancy_name: os.path.join(output_dir, Report.get_unique_dir_name(vacancy_name, used))
+                       for vacancy_name in reports}
+        metrics = PipelineMetrics.active
+        generate, extra = Report.generate_reports, ()
+        if metrics is not None:
+            generate, extra = Report.generate_reports_measured, (metrics.trace_memory,)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(generate, data, vacancy_name, directories[vacancy_name], formats,
+                                       quantiles.get(vacancy_name), *extra)
+                       for vacancy_name, data in reports.items()]
+            for future in futures:
+                result = future.result()
+                if metrics is not None:
+                    metrics.merge(result)
+        return directories
+
+    @staticmethod
+    def generate_reports_measured(data: tuple, vacancy_name: str, output_dir: str,
+                                  formats=('excel', 'image', 'pdf'), quantiles: dict = None, trace_memory=False):
+        """
+        Метод generate_reports с собственными метриками, выполняется в процессе-воркере.
+        Метрики возвращаются в родительский процесс и добавляются к его метрикам через PipelineMetrics.merge
+        :param (tuple) data: шесть словарей статистики в порядке аргументов generate_excel
+        :param (str) vacancy_name: название требуемой вакансии
+        :param (str) output_dir: папка для результата
+        :param formats: какие отчёты генерировать: excel, image, pdf
+        :param (dict) quantiles: квантили зарплат из StatisticsAggregator.get_quantiles
+        :param (bool) trace_memory: замерять пик памяти стадий
+        :return: (PipelineMetrics) метрики воркера
+        """
+        with PipelineMetrics(trace_memory=trace_memory) as metrics:
+            Report.generate_reports(data, vacancy_name, output_dir, formats, quantiles)
+        return metrics
+
+    @staticmethod
+    def get_dir_name(vacancy_name: str) -> str:
+        """
+        Метод получения безопасного имени папки по названию профессии
+        :param (str) vacancy_name: название профессии
+        :return: (str) имя папки
+        """
+        return re.sub(r'[\\/:*?"<>|\s]+', '_', vacancy_name).strip('._') or '_'
+
+    @staticmethod
+    def get_unique_dir_name(vacancy_name: str, used: set) -> str:
+        """
+        Метод получения имени папки, не совпадающего с уже выданными (без учёта регистра):
+        разные профессии, например "C++ dev" и "C++_dev", не должны писать в одну папку
+        :param (str) vacancy_name: название профессии
+        :param (set) used: выданные имена в нижнем регистре, дополняется новым именем
+        :return: (str) имя папки
+        """
+        base = dir_name = Report.get_dir_name(vacancy_name)
+        suffix = 1
+        while dir_name.lower() in used:
+            suffix += 1
+            dir_name = f'{base}_{suffix}'
+        used.add(dir_name.lower())
+        return dir_name
 
     @staticmethod
     def set_graphic(item, X_axis, width_const, label1, label2, item_bar1, item_bar2, title):
@@ -369,30 +2231,57 @@ class Report:
         return item
 
     @staticmethod
-    def set_bold_font(sheet, *cells):
+    def get_excel_styles():
         """
-        Метод установки жирного шрифта
-        :param sheet: холст
-        :param cells: ячейки
-        :return: холст
+        Метод получения общих для всех ячеек стилей, объекты создаются один раз
+        :return: (dict) {'border': рамка ячейки, 'bold': жирный шрифт}
         """
-        for cell in cells:
-            sheet[cell].font = Font(bold=True)
-        return sheet
+        if Report.excel_styles is None:
+            from openpyxl.styles import Font, Border, Side
+            side_thin = Side(border_style="thin", color="000000")
+            Report.excel_styles = {'border': Border(top=side_thin, left=side_thin, right=side_thin, bottom=side_thin),
+                                   'bold': Font(bold=True)}
+        return Report.excel_styles
 
     @staticmethod
-    def set_value_in_cell(sheet, cell: str, value: str, side_thin: Side):
+    def write_sheet(wb, title: str, get_rows, number_formats=None):
         """
-        Метод установки значения в холст
-        :param sheet: холст
-        :param cell: ячейка
-        :param value: значение
-        :param side_thin: сторона
-        :return:
+        Метод потоковой записи листа в write-only книгу.
+        В write-only режиме ширину колонок нужно задать до первой строки, поэтому get_rows вызывается дважды:
+        первый проход считает максимальную длину значений по колонкам, второй пишет строки.
+        Ячейки не хранятся в памяти, все ячейки используют общие объекты стилей
+        :param wb: write-only книга
+        :param (str) title: название листа
+        :param get_rows: функция без аргументов, возвращающая итератор строк; первая строка - заголовок
+        :param (dict) number_formats: {индекс колонки: формат числа} для строк после заголовка
         """
-        sheet[cell] = value
-        sheet[cell].border = Border(top=side_thin, left=side_thin, right=side_thin, bottom=side_thin)
-        return sheet
+        from openpyxl.cell import WriteOnlyCell
+        from openpyxl.utils import get_column_letter
+        styles = Report.get_excel_styles()
+        widths = []
+        for row in get_rows():
+            for index, value in enumerate(row):
+                if index == len(widths):
+                    widths.append(0)
+                widths[index] = max(widths[index], len(Report.try_parse(value)))
+
+        sheet = wb.create_sheet(title)
+        for index, width in enumerate(widths, start=1):
+            sheet.column_dimensions[get_column_letter(index)].width = width + 2
+        for row_index, row in enumerate(get_rows()):
+            cells = []
+            for index, value in enumerate(row):
+                if value is None:
+                    cells.append(None)
+                    continue
+                cell = WriteOnlyCell(sheet, value)
+                cell.border = styles['border']
+                if row_index == 0:
+                    cell.font = styles['bold']
+                elif number_formats and index in number_formats:
+                    cell.number_format = number_formats[index]
+                cells.append(cell)
+            sheet.append(cells)
 
     @staticmethod
     def try_parse(item) -> str:
@@ -413,56 +2302,250 @@ class DataSet:
     :argument (str): file_name: Название файла
     :argument (dict): vacancies_objects: Обект с паршенными данными
     """
-    def __init__(self, file_name):
+    VACANCY_COLUMNS = ('name', 'salary_from', 'salary_to', 'salary_currency', 'area_name', 'published_at')
+    TAG_PATTERN = re.compile(r"<[^>]+>")
+
+    def __init__(self, file_name, stream=False, columns=()):
+        """
+        :param (str) file_name: название файла
+        :param (bool) stream: если True, vacancies_objects - генератор, строки читаются и парсятся по одной
+        :param columns: дополнительные колонки (например, description), доступны через Vacancy.get_field
+        """
         self.file_name = file_name
-        self.vacancies_objects = DataSet.parser_csv(file_name)
+        if stream:
+            self.vacancies_objects = DataSet.iter_vacancies(file_name, columns)
+        else:
+            self.vacancies_objects = DataSet.parser_csv(file_name, columns)
 
     @staticmethod
     def clear_str(str_value):
         """
-        Метод очищения строки от html
+        Метод очищения строки от html, регулярное выражение запускается только если в строке есть тег
         :param (str): str_value строка для очистки
         :return: очищенная строка
         """
-        return ' '.join(re.sub(r"<[^>]+>", '', str_value).split())
+        if '<' in str_value:
+            str_value = DataSet.TAG_PATTERN.sub('', str_value)
+        return ' '.join(str_value.split())
+
+    @staticmethod
+    def clear_field(value):
+        """
+        Метод очищения поля csv: многострочное поле очищается построчно и возвращается списком
+        :param (str) value: поле
+        :return: очищенная строка или список строк
+        """
+        if '\n' in value:
+            return [DataSet.clear_str(line) for line in value.split('\n')]
+        return DataSet.clear_str(value)
+
+    @staticmethod
+    def read_rows(file_name):
+        """
+        Генератор строк csv, файл читается построчно и закрывается после последней строки
+        :param file_name: названия файла
+        """
+        with open(file_name, encoding='utf_8_sig') as file:
+            yield from csv.reader(file)
+            if PipelineMetrics.active is not None:
+                PipelineMetrics.active.count('bytes_read', file.buffer.tell())
 
     @staticmethod
     def csv_reader(file_name):
         """
         Метод чтения строк из csv
         :param file_name: названия файла
+        :return: заголовок и итератор по остальным строкам
         """
-        file = open(file_name, encoding='utf_8_sig')
-        reader = [row for row in csv.reader(file)]
+        reader = DataSet.read_rows(file_name)
         try:
-            name = reader.pop(0)
+            name = next(reader)
             return name, reader
-        except:
+        except StopIteration:
             print('Пустой файл')
             exit()
 
     @staticmethod
-    def parser_csv(file_name):
+    def get_row_parser(naming, columns=()):
         """
-        Метод парсинга строки
+        Метод получения функции парсинга строки. Очищаются только колонки, нужные Vacancy,
+        дополнительные колонки сохраняются как LazyText и очищаются при обращении, остальные не обрабатываются
+        :param (list) naming: заголовок csv
+        :param columns: дополнительные колонки
+        :return: функция строка csv -> Vacancy
+        """
+        index = {column: position for position, column in enumerate(naming)}
+        name, salary_from, salary_to, salary_currency, area_name, published_at = \
+            (index[column] for column in DataSet.VACANCY_COLUMNS)
+        extra = [(column, index[column]) for column in columns]
+        clear = DataSet.clear_field
+
+        def parse(row):
+            fields = {column: LazyText(row[position]) for column, position in extra} if extra else None
+            return Vacancy(clear(row[name]), Salary(clear(row[salary_from]), clear(row[salary_to]),
+                                                    clear(row[salary_currency])),
+                           clear(row[area_name]), clear(row[published_at]), fields)
+        return parse
+
+    @staticmethod
+    def iter_vacancies(file_name, columns=()):
+        """
+        Генератор вакансий: строки читаются, фильтруются и парсятся по одной, файл целиком в память не загружается
         :param (str) file_name: название файла
-        :return: распаршенный объект
+        :param columns: дополнительные колонки, см. get_row_parser
+        :return: генератор Vacancy
         """
         naming, reader = DataSet.csv_reader(file_name)
-        dict_vacancies = []
-        filtered_vacancies = [item for item in reader if len(item) == len(naming) and '' not in item]
-        for row in filtered_vacancies:
-            dict = {}
-            for index in range(0, len(row)):
-                if row[index].find("\n") != -1:
-                    answer = [DataSet.clear_str(el) for el in row[index].split('\n')]
+        parse = DataSet.get_row_parser(naming, columns)
+        if PipelineMetrics.active is not None:
+            yield from DataSet.iter_vacancies_measured(PipelineMetrics.active, naming, reader, parse)
+            return
+        for row in reader:
+            if len(row) == len(naming) and '' not in row:
+                yield parse(row)
+
+    @staticmethod
+    def iter_vacancies_measured(metrics, naming, reader, parse):
+        """
+        Тот же цикл, что и в iter_vacancies, но с замером чтения csv и парсинга строк по отдельности.
+        Время и счётчики накапливаются локально и записываются в метрики один раз, в том числе при прерывании
+        :param (PipelineMetrics) metrics: метрики
+        :param (list) naming: заголовок csv
+        :param reader: итератор строк csv
+        :param parse: функция парсинга строки
+        :return: генератор Vacancy
+        """
+        clock = time.perf_counter
+        read_seconds = parse_seconds = 0.0
+        read = dropped = 0
+        try:
+            start = clock()
+            for row in reader:
+                parsed = clock()
+                read_seconds += parsed - start
+                read += 1
+                if len(row) == len(naming) and '' not in row:
+                    vacancy = parse(row)
+                    parse_seconds += clock() - parsed
+                    yield vacancy
                 else:
-                    answer = DataSet.clear_str(row[index])
-                dict[naming[index]] = answer
-            dict_vacancies.append(
-                Vacancy(dict['name'], Salary(dict['salary_from'], dict['salary_to'], dict['salary_currency']),
-                        dict['area_name'], dict['published_at']))
-        return dict_vacancies
+                    dropped += 1
+                start = clock()
+            read_seconds += clock() - start
+        finally:
+            metrics.count('rows_read', read)
+            metrics.count('rows_dropped', dropped)
+            metrics.count('rows_parsed', read - dropped)
+            metrics.add_time('csv_reader', read_seconds)
+            metrics.add_time('parse_row', parse_seconds, read - dropped)
+
+    @staticmethod
+    def get_record_bounds(file_name, offsets, block_size=1024 * 1024):
+        """
+        Метод поиска границ записей csv.
+        Для каждого смещения находит начало первой записи, которая начинается строго после него.
+        Перевод строки считается концом записи, если до него в файле чётное число кавычек,
+        поэтому многострочные поля в кавычках не разрываются. Файл читается блоками, кавычки считаются через bytes.count
+        :param (str) file_name: название файла
+        :param (list) offsets: возрастающие смещения в байтах
+        :param (int) block_size: размер блока чтения
+        :return: (list) возрастающие смещения начал записей без повторов
+        """
+        bounds = []
+        targets = iter(offsets)
+        target = next(targets, None)
+        position = 0
+        odd_quotes = False
+        with open(file_name, 'rb') as file:
+            while target is not None:
+                block = file.read(block_size)
+                if not block:
+                    break
+                counted = 0
+                search = max(target - position, 0)
+                while target is not None:
+                    newline = block.find(b'\n', search)
+                    if newline == -1:
+                        break
+                    odd_quotes ^= block.count(b'"', counted, newline) % 2 == 1
+                    counted = newline
+                    if odd_quotes:
+                        search = newline + 1
+                        continue
+                    bound = position + newline + 1
+                    if not bounds or bounds[-1] != bound:
+                        bounds.append(bound)
+                    while target is not None and target < bound:
+                        target = next(targets, None)
+                    if target is not None:
+                        search = max(target - position, newline + 1)
+                odd_quotes ^= block.count(b'"', counted) % 2 == 1
+                position += len(block)
+        return bounds
+
+    @staticmethod
+    def aggregate_chunk(file_name, start, end, naming, vac_name, rates=None, quantiles=False):
+        """
+        Метод парсинга и агрегации одного диапазона байт файла, выполняется в процессе-воркере
+        :param (str) file_name: название файла
+        :param (int) start: начало диапазона (начало записи)
+        :param (int) end: конец диапазона (начало следующей записи или конец файла)
+        :param (list) naming: заголовок csv
+        :param (str) vac_name: название нужнуй вакансии
+        :param (CurrencyRates) rates: курсы валют по месяцам
+        :param (bool) quantiles: считать скетчи квантилей
+        :return: (StatisticsAggregator) частичный результат
+        """
+        with open(file_name, 'rb') as file:
+            file.seek(start)
+            data = file.read(end - start)
+        aggregator = StatisticsAggregator(vac_name, rates, quantiles)
+        for vacancy in DataSet.iter_chunk_vacancies(data, naming):
+            aggregator.add(vacancy)
+        return aggregator
+
+    @staticmethod
+    def iter_chunk_vacancies(data: bytes, naming):
+        """
+        Генератор вакансий из куска файла, который начинается и заканчивается на границе записей
+        :param (bytes) data: байты куска файла без заголовка
+        :param (list) naming: заголовок csv
+        :return: генератор Vacancy
+        """
+        parse = DataSet.get_row_parser(naming)
+        for row in csv.reader(io.TextIOWrapper(io.BytesIO(data), encoding='utf_8')):
+            if len(row) == len(naming) and '' not in row:
+                yield parse(row)
+
+    @staticmethod
+    def get_last_record_end(data: bytes) -> int:
+        """
+        Метод поиска конца последней полной записи в куске файла, который начинается с начала записи
+        :param (bytes) data: байты куска файла
+        :return: (int) длина части куска из полных записей
+        """
+        end = 0
+        counted = 0
+        odd_quotes = False
+        newline = data.find(b'\n')
+        while newline != -1:
+            odd_quotes ^= data.count(b'"', counted, newline) % 2 == 1
+            counted = newline
+            if not odd_quotes:
+                end = newline + 1
+            newline = data.find(b'\n', newline + 1)
+        return end
+
+    @staticmethod
+    @PipelineMetrics.timed('parser_csv')
+    def parser_csv(file_name, columns=()):
+        """
+        Метод парсинга строки
+        :param (str) file_name: название файла
+        :param columns: дополнительные колонки, см. get_row_parser
+        :return: распаршенный объект
+        """
+        return list(DataSet.iter_vacancies(file_name, columns))
 
 
 def get_experience_id(value: str):
@@ -491,17 +2574,366 @@ true_false_reverse = {
     "Да": "True",
 }
 
+class QueryServer(ThreadingHTTPServer):
+    """
+    Локальный http-сервис статистики: таблица вакансий загружается один раз и держится в памяти
+    вместе с индексом названий и общей статистикой, поэтому запрос по профессии не перечитывает файл.
+    Отчёты рисуются в пуле процессов, запрос на отчёт сразу возвращает номер задачи.
+
+    GET /health, GET /professions?q=&limit=, GET /statistics?vacancy=&granularity=,
+    POST /reports {"vacancy": ..., "formats": [...]}, GET /reports/<номер задачи>
+
+    Attributes:
+        table (VacancyTable): таблица вакансий
+        output_dir (str): корневая папка для отчётов
+        executor (ProcessPoolExecutor): пул процессов для отчётов
+        jobs (dict): задачи {номер: (профессия, папка, future)}
+        directories (dict): папки отчётов {профессия: папка}, у разных профессий папки разные,
+            каждая задача пишет в свою подпапку <папка профессии>/<номер задачи>
+        name_counts (np.ndarray): количество вакансий по кодам названий, считается один раз при запуске
+    """
+    daemon_threads = True
+    GRANULARITIES = ('year', 'day', 'week', 'month', 'quarter')
+    FORMATS = ('excel', 'image', 'pdf')
+
+    def __init__(self, address, table, output_dir='reports', workers=None):
+        """
+        :param (tuple) address: (хост, порт)
+        :param (VacancyTable) table: таблица вакансий
+        :param (str) output_dir: корневая папка для отчётов
+        :param (int) workers: количество процессов для отчётов, по умолчанию os.cpu_count()
+        """
+        super().__init__(address, QueryHandler)
+        self.table = table
+        self.output_dir = output_dir
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+        self.jobs = {}
+        self.jobs_lock = threading.Lock()
+        self.directories = {}
+        self.used_dir_names = set()
+        self.name_counts = np.empty(0, dtype=np.intp)
+        if len(table):
+            table.get_overall_data()
+            table.get_rollups()
+            self.name_counts = np.diff(table.get_name_index().row_offsets)
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(cancel_futures=True)
+
+    def get_statistics(self, vac_name: str, granularity: str = 'year'):
+        """
+        Метод получения статистики по профессии
+        :param (str) vac_name: название профессии
+        :param (str) granularity: year, day, week, month или quarter
+        :return: (dict) шесть словарей статистики под именами как в generate_excel
+        """
+        if granularity == 'year' or len(self.table) == 0:
+            data = self.table.get_data_for_table(vac_name)
+        else:
+            data = self.table.get_rollups().get_data_for_table(vac_name, granularity)
+        return dict(zip(('years_salary', 'years_count', 'years_salary_vacancy', 'years_count_vacancy',
+                         'area_salary', 'area_count'), data))
+
+    def get_professions(self, query: str, limit: int = 20):
+        """
+        Метод поиска названий профессий по подстроке
+        :param (str) query: подстрока названия
+        :param (int) limit: максимальное количество названий
+        :return: (list) [{'name': название, 'count': количество вакансий}] по убыванию количества
+        """
+        if len(self.table) == 0:
+            return []
+        codes = self.table.get_name_index().find(query)
+        counts = self.name_counts
+        codes = heapq.nlargest(limit, codes, key=lambda code: counts[code])
+        return [{'name': self.table.names[code], 'count': int(counts[code])} for code in codes]
+
+    def submit_report(self, vac_name: str, formats=('excel', 'image', 'pdf')) -> int:
+        """
+        Метод постановки отчёта в пул процессов, статистика считается в сервисе по тёплой таблице.
+        Отчёты задачи пишутся в <папка профессии>/<номер задачи>, поэтому задачи по одной профессии не пересекаются
+        :param (str) vac_name: название профессии
+        :param formats: какие отчёты генерировать: excel, image, pdf
+        :return: (int) номер задачи
+        """
+        data = self.table.get_data_for_table(vac_name)
+        with self.jobs_lock:
+            if vac_name not in self.directories:
+                self.directories[vac_name] = os.path.join(
+                    self.output_dir, Report.get_unique_dir_name(vac_name, self.used_dir_names))
+            job_id = len(self.jobs) + 1
+            directory = os.path.join(self.directories[vac_name], str(job_id))
+            future = self.executor.submit(Report.generate_reports, data, vac_name, directory, tuple(formats))
+            self.jobs[job_id] = (vac_name, directory, future)
+        return job_id
+
+    def get_job(self, job_id: int):
+        """
+        Метод получения состояния задачи
+        :param (int) job_id: номер задачи
+        :return: (dict) состояние, None если задачи нет
+        """
+        if job_id not in self.jobs:
+            return None
+        vac_name, directory, future = self.jobs[job_id]
+        job = {'id': job_id, 'vacancy': vac_name, 'directory': directory}
+        if not future.done():
+            job['status'] = 'running'
+        elif future.exception() is not None:
+            job['status'] = 'failed'
+            job['error'] = f'{type(future.exception()).__name__}: {future.exception()}'
+        else:
+            job['status'] = 'done'
+        return job
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """
+    Обработчик запросов QueryServer, ответы в json
+    """
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        if url.path == '/health':
+            self.send_json(200, {'status': 'ok', 'vacancies': len(self.server.table)})
+        elif url.path == '/professions':
+            limit = query.get('limit', '20')
+            if not limit.isdigit():
+                self.send_json(400, {'error': 'limit должен быть числом'})
+                return
+            self.send_json(200, self.server.get_professions(query.get('q', ''), int(limit)))
+        elif url.path == '/statistics':
+            granularity = query.get('granularity', 'year')
+            if 'vacancy' not in query or granularity not in QueryServer.GRANULARITIES:
+                self.send_json(400, {'error': 'нужен параметр vacancy, granularity: '
+                                              + ', '.join(QueryServer.GRANULARITIES)})
+                return
+            self.send_json(200, self.server.get_statistics(query['vacancy'], granularity))
+        elif url.path.startswith('/reports/') and url.path[len('/reports/'):].isdigit():
+            job = self.server.get_job(int(url.path[len('/reports/'):]))
+            self.send_json(200 if job else 404, job or {'error': 'задача не найдена'})
+        else:
+            self.send_json(404, {'error': 'неизвестный путь'})
+
+    def do_POST(self):
+        if urlsplit(self.path).path != '/reports':
+            self.send_json(404, {'error': 'неизвестный путь'})
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            vac_name = body['vacancy']
+            formats = body.get('formats', list(QueryServer.FORMATS))
+        except (ValueError, KeyError, TypeError):
+            vac_name = formats = None
+        if not isinstance(vac_name, str) or not isinstance(formats, list) \
+                or not all(isinstance(item, str) and item in QueryServer.FORMATS for item in formats):
+            self.send_json(400, {'error': 'ожидается json {"vacancy": строка, "formats": список из '
+                                          + ', '.join(QueryServer.FORMATS) + '}'})
+            return
+        job_id = self.server.submit_report(vac_name, formats)
+        self.send_json(202, self.server.get_job(job_id))
+
+    def send_json(self, status: int, payload):
+        """
+        Метод отправки json ответа
+        :param (int) status: http статус
+        :param payload: данные ответа
+        """
+        body = json.dumps(payload, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class CommandLine:
+    """
+    Неинтерактивный интерфейс командной строки. Без аргументов запускается прежний диалог через input()
+
+    python main.py stats vacancies.csv Программист [--granularity month] [--rates rates.csv] [--json]
+    python main.py stats vacancies.csv Программист --incremental [--state vacancies.csv.state.json]
+    python main.py stats vacancies.csv Программист --quantiles  # потоковый проход мимо кэша, только по годам
+    python main.py report vacancies.csv Программист --quantiles  # квантили в excel и pdf
+    python main.py report vacancies.csv Программист Аналитик [-o reports] [--formats excel image] [--incremental]
+    python main.py serve vacancies.csv [--port 8000]
+    """
+    COMMANDS = ('stats', 'report', 'serve')
+
+    @staticmethod
+    def get_parser():
+        """
+        Метод построения парсера аргументов
+        :return: (argparse.ArgumentParser) парсер
+        """
+        parser = argparse.ArgumentParser(description='Статистика и отчёты по вакансиям')
+        parser.add_argument('--metrics', default=os.environ.get('PIPELINE_METRICS'),
+                            help='сохранить метрики конвейера: .json, .prom или .pstats (профиль cProfile); '
+                                 'время отчётов из пула процессов команды report учитывается, '
+                                 'профиль cProfile снимается только в основном процессе')
+        commands = parser.add_subparsers(dest='command', required=True)
+
+        stats = commands.add_parser('stats', help='вывести статистику по профессии')
+        stats.add_argument('file_name')
+        stats.add_argument('vacancy')
+        stats.add_argument('--granularity', choices=QueryServer.GRANULARITIES, default='year')
+        stats.add_argument('--rates', help='курсы валют по месяцам, csv или json')
+        stats.add_argument('--quantiles', action='store_true',
+                           help='посчитать квантили зарплат: файл читается потоково мимо кэша, только по годам')
+        stats.add_argument('--json', action='store_true', help='вывести результат в json')
+        CommandLine.add_incremental_arguments(stats)
+
+        report = commands.add_parser('report', help='сгенерировать отчёты по профессиям')
+        report.add_argument('file_name')
+        report.add_argument('vacancies', nargs='+')
+        report.add_argument('-o', '--output-dir', default='reports')
+        report.add_argument('--formats', nargs='+', choices=('excel', 'image', 'pdf'),
+                            default=['excel', 'image', 'pdf'])
+        report.add_argument('--workers', type=int)
+        report.add_argument('--rates', help='курсы валют по месяцам, csv или json')
+        report.add_argument('--quantiles', action='store_true',
+                            help='добавить квантили зарплат в excel и pdf: файл читается мимо кэша, '
+                                 'по одному параллельному проходу на профессию')
+        CommandLine.add_incremental_arguments(report)
+
+        serve = commands.add_parser('serve', help='запустить http-сервис статистики')
+        serve.add_argument('file_name')
+        serve.add_argument('--host', default='127.0.0.1')
+        serve.add_argument('--port', type=int, default=8000)
+        serve.add_argument('-o', '--output-dir', default='reports')
+        serve.add_argument('--workers', type=int)
+        return parser
+
+    @staticmethod
+    def add_incremental_arguments(parser):
+        """
+        Метод добавления аргументов режима дозагрузки
+        :param parser: парсер команды
+        """
+        parser.add_argument('--incremental', action='store_true',
+                            help='учитывать только строки, дописанные с прошлого запуска (IncrementalState)')
+        parser.add_argument('--state', help='файл состояния, по умолчанию <file_name>.state.json')
+
+    @staticmethod
+    def run(argv):
+        """
+        Метод запуска команды
+        :param (list) argv: аргументы без имени программы
+        :return: (int) код выхода
+        """
+        if not argv:
+            CommandLine.interact()
+            return 0
+        if argv[0] not in CommandLine.COMMANDS and not argv[0].startswith('-') and len(argv) > 1:
+            argv = ['report'] + argv
+        parser = CommandLine.get_parser()
+        args = parser.parse_args(argv)
+        if getattr(args, 'incremental', False) and getattr(args, 'granularity', 'year') != 'year':
+            parser.error('--incremental хранит статистику только по годам, --granularity не поддерживается')
+        if getattr(args, 'incremental', False) and getattr(args, 'quantiles', False):
+            parser.error('--incremental не хранит скетчи квантилей, используйте --quantiles без --incremental')
+        if getattr(args, 'quantiles', False) and getattr(args, 'granularity', 'year') != 'year':
+            parser.error('--quantiles считаются только по годам, --granularity не поддерживается')
+        if getattr(args, 'state', None) and not args.incremental:
+            parser.error('--state используется только вместе с --incremental')
+        metrics = PipelineMetrics(profile=args.metrics.endswith('.pstats'),
+                                  trace_memory=os.environ.get('PIPELINE_TRACE_MEMORY') == '1') \
+            if args.metrics else None
+        with metrics or nullcontext():
+            getattr(CommandLine, args.command)(args)
+        if metrics is not None:
+            metrics.save(args.metrics)
+        return 0
+
+    @staticmethod
+    def stats(args):
+        """
+        Команда stats: вывод статистики по профессии
+        :param args: аргументы командной строки
+        """
+        rates = CurrencyRates.load(args.rates) if args.rates else None
+        quantiles = None
+        if args.quantiles:
+            aggregator = InputConnect.aggregate_stream(DataSet(args.file_name, stream=True).vacancies_objects,
+                                                       args.vacancy, rates, quantiles=True)
+            data = aggregator.get_data()
+            quantiles = aggregator.get_quantiles()
+        elif args.incremental:
+            data = InputConnect.get_data_incremental(args.file_name, args.vacancy, args.state, rates)
+        else:
+            table = VacancyTable.from_cache(args.file_name).use_rates(rates)
+            if args.granularity == 'year' or len(table) == 0:
+                data = table.get_data_for_table(args.vacancy)
+            else:
+                data = table.get_rollups().get_data_for_table(args.vacancy, args.granularity)
+        if args.json:
+            result = dict(zip(('years_salary', 'years_count', 'years_salary_vacancy', 'years_count_vacancy',
+                               'area_salary', 'area_count'), data))
+            if quantiles:
+                result['quantiles'] = quantiles
+            print(json.dumps(result, ensure_ascii=False))
+        else:
+            InputConnect.show_data(*data, quantiles=quantiles)
+
+    @staticmethod
+    def report(args):
+        """
+        Команда report: пакетная генерация отчётов
+        :param args: аргументы командной строки
+        """
+        rates = CurrencyRates.load(args.rates) if args.rates else None
+        if args.quantiles:
+            aggregators = {vacancy_name: InputConnect.aggregate_parallel(args.file_name, vacancy_name, args.workers,
+                                                                         rates=rates, quantiles=True)
+                           for vacancy_name in args.vacancies}
+            directories = Report.generate_batch_data(
+                {vacancy_name: aggregator.get_data() for vacancy_name, aggregator in aggregators.items()},
+                args.output_dir, args.workers, tuple(args.formats),
+                {vacancy_name: aggregator.get_quantiles() for vacancy_name, aggregator in aggregators.items()})
+        elif args.incremental:
+            state = InputConnect.get_state_incremental(args.file_name, args.state, rates)
+            directories = Report.generate_batch_data({vacancy_name: state.get_data(vacancy_name)
+                                                      for vacancy_name in args.vacancies},
+                                                     args.output_dir, args.workers, tuple(args.formats))
+        else:
+            directories = Report.generate_batch(VacancyTable.from_cache(args.file_name).use_rates(rates),
+                                                args.vacancies, args.output_dir, args.workers, tuple(args.formats))
+        for vacancy_name, directory in directories.items():
+            print(f"{vacancy_name}: {directory}")
+
+    @staticmethod
+    def serve(args):
+        """
+        Команда serve: запуск http-сервиса, работает до Ctrl+C
+        :param args: аргументы командной строки
+        """
+        server = QueryServer((args.host, args.port), VacancyTable.from_cache(args.file_name), args.output_dir,
+                             args.workers)
+        print(f"http://{args.host}:{server.server_address[1]} ({len(server.table)} вакансий)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+    @staticmethod
+    def interact():
+        """
+        Прежний интерактивный режим: файл, профессия и тип вывода вводятся с клавиатуры
+        """
+        years_salary, years_count, years_salary_vacancy, years_count_vacancy, area_salary, area_count, \
+            vacancy_name = InputConnect.connect()
+        choice = input("Вакансии или статистика?").strip().lower()
+        Report.generate_excel(years_salary, years_count, years_salary_vacancy, years_count_vacancy,
+                              area_salary, area_count, vacancy_name)
+        if choice == "вакансии":
+            Report.generate_image(years_salary, years_count, years_salary_vacancy, years_count_vacancy,
+                                  area_salary, area_count, vacancy_name)
+            Report.generate_pdf(years_salary, years_count, years_salary_vacancy, years_count_vacancy,
+                                area_salary, area_count, vacancy_name)
+
+
 if __name__ == '__main__':
-    years_salary, years_count, years_salary_vacancy, years_count_vacancy, area_salary, area_count, vacancy_name \
-        = InputConnect.connect()
-    choice = input("Вакансии или статистика?").strip().lower()
-    if choice == "вакансии":
-        Report.generate_excel(years_salary, years_count, years_salary_vacancy, years_count_vacancy, area_salary,
-                              area_count, vacancy_name)
-        Report.generate_image(years_salary, years_count, years_salary_vacancy, years_count_vacancy, area_salary,
-                              area_count, vacancy_name)
-        Report.generate_pdf(years_salary, years_count, years_salary_vacancy, years_count_vacancy, area_salary,
-                            area_count, vacancy_name)
-    else:
-        Report.generate_excel(years_salary, years_count, years_salary_vacancy, years_count_vacancy, area_salary,
-                              area_count, vacancy_name)
+    sys.exit(CommandLine.run(sys.argv[1:]))